@@ -0,0 +1,369 @@
+"""
+Offline CPU benchmarks for the inference, refine and data-loading hot paths.
+
+Every input is synthetic and seeded, so runs are comparable across machines of the
+same class. Results are written as JSON and, when a baseline exists, compared
+against it; the script exits non-zero if any benchmark regressed past --tolerance.
+
+Example:
+    python benchmarks/run_benchmarks.py --save-baseline     # record benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py                     # compare against it
+"""
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+# Benchmarks are CPU-only so numbers do not depend on whichever GPU happens to be present
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+# Timings do not depend on the weight values, so a missing checkpoint is fine here
+os.environ.setdefault("COLORIZE_ALLOW_UNTRAINED", "1")
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from training.dataset import ColorizationDataset
+from webapp.backend import main as backend
+from webapp.backend.decoding import decode_l_plane
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def synthetic_image(height, width, seed=0):
+    """Deterministic 'photo-like' BGR image: gradients, shapes, text and grain."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 60 + 120 * (x / max(width - 1, 1)) * (0.5 + 0.5 * np.sin(y / max(height, 1) * np.pi))
+    img = cv2.merge([base, base * 0.9, base * 0.8]).astype(np.uint8)
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(max(2, min(height, width) // 40), max(3, min(height, width) // 6)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(img, center, radius, color, -1)
+    cv2.putText(img, "benchmark", (width // 10, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                max(0.5, width / 400), (10, 10, 10), max(1, width // 200))
+    noise = rng.normal(0, 6, img.shape).astype(np.float32)
+    return np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def stroke_mask(height, width, stroke):
+    """Square brush stroke of side `stroke` centred in the frame."""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    half = stroke // 2
+    cy, cx = height // 2, width // 2
+    mask[max(0, cy - half):cy + half, max(0, cx - half):cx + half] = 255
+    return mask
+
+
+def time_call(fn, repeat, warmup):
+    """Runs fn warmup + repeat times and returns timing stats in seconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "median_s": samples[len(samples) // 2],
+        "mean_s": sum(samples) / len(samples),
+        "min_s": samples[0],
+        "max_s": samples[-1],
+        "repeat": repeat,
+    }
+
+
+def bench_forward(results, args):
+    for res in args.resolutions:
+        img = synthetic_image(res, res, seed=res)
+        results[f"run_model_internal/{res}px"] = time_call(lambda: backend.run_model_internal(img), args.repeat, args.warmup)
+
+    patch = synthetic_image(512, 512, seed=7)
+    for batch in args.batch_sizes:
+        patches = [patch] * batch
+        stats = time_call(lambda: backend.run_model_batch(patches), args.repeat, args.warmup)
+        stats["per_patch_s"] = stats["median_s"] / batch
+        results[f"run_model_batch/b{batch}"] = stats
+
+
+def allocation_stats(fn, calls):
+    """
+    Allocation cost of fn per call: peak host bytes allocated through tracemalloc (numpy
+    buffers, Python objects), torch CPU tensor allocations seen by the profiler, and the
+    number of garbage collections triggered over `calls` calls.
+    """
+    fn()
+    peaks = []
+    tracemalloc.start()
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    for _ in range(calls):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections
+    tracemalloc.stop()
+
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    tensor_allocs = sum(1 for e in prof.events()
+                        if e.name in ("aten::empty", "aten::empty_strided") and e.cpu_memory_usage > 0)
+    return {"host_peak_bytes": sorted(peaks)[len(peaks) // 2], "torch_allocations": tensor_allocs,
+            "gc_collections": collections, "calls": calls}
+
+
+def bench_allocations(results, args):
+    """run_model_batch and the full grid pipeline with reused inference buffers vs per-call allocation."""
+    original = backend.INFERENCE_BUFFERS
+    patch = synthetic_image(512, 512, seed=7)
+    img = synthetic_image(1024, 1365, seed=1024)
+    try:
+        for label, enabled in (("buffered", True), ("fresh", False)):
+            backend.INFERENCE_BUFFERS = enabled
+            for batch in args.batch_sizes:
+                patches = [cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)] * batch
+                stats = time_call(lambda: backend.run_model_batch(patches), args.repeat, args.warmup)
+                stats.update(allocation_stats(lambda: backend.run_model_batch(patches), args.repeat))
+                results[f"allocations/run_model_batch/b{batch}/{label}"] = stats
+            stats = time_call(lambda: backend.process_inference(img), args.repeat, args.warmup)
+            stats.update(allocation_stats(lambda: backend.process_inference(img), args.repeat))
+            results[f"allocations/process_inference/1024px/{label}"] = stats
+    finally:
+        backend.INFERENCE_BUFFERS = original
+
+
+def bench_inference(results, args):
+    original_grid = backend.GRID_SIZE
+    try:
+        for res in args.resolutions:
+            img = synthetic_image(res, int(res * 4 / 3), seed=res)
+            for grid in args.grid_sizes:
+                backend.GRID_SIZE = grid
+                results[f"process_inference/{res}px/grid{grid}"] = time_call(
+                    lambda: backend.process_inference(img), args.repeat, args.warmup)
+            results[f"process_inference/{res}px/adaptive"] = time_call(
+                lambda: backend.process_inference(img, adaptive=True), args.repeat, args.warmup)
+    finally:
+        backend.GRID_SIZE = original_grid
+
+
+def ab_l1(result_bgr, reference_bgr):
+    """Mean absolute AB difference (LAB units) between two BGR images."""
+    a = cv2.cvtColor(result_bgr, cv2.COLOR_BGR2LAB)[:, :, 1:].astype(np.float32)
+    b = cv2.cvtColor(reference_bgr, cv2.COLOR_BGR2LAB)[:, :, 1:].astype(np.float32)
+    return float(np.mean(np.abs(a - b)))
+
+
+def bench_native(results, args):
+    """Single native-resolution forward vs the 4x4 grid: latency and color agreement.
+    `ab_l1_vs_source` compares against the synthetic image's own colors (meaningful with
+    trained weights); `ab_l1_vs_grid` measures how far native output drifts from grid output."""
+    original_grid = backend.GRID_SIZE
+    backend.GRID_SIZE = 4
+    try:
+        for res in args.resolutions:
+            img = synthetic_image(res, int(res * 4 / 3), seed=res)
+            grid_result, _ = backend.process_inference(img)
+            stats = time_call(lambda: backend.process_inference(img), args.repeat, args.warmup)
+            stats["ab_l1_vs_source"] = ab_l1(grid_result, img)
+            results[f"native_vs_grid/{res}px/grid4"] = stats
+
+            for working_size in args.working_sizes:
+                native_result, metrics = backend.process_inference(img, mode="native", working_size=working_size)
+                stats = time_call(lambda: backend.process_inference(img, mode="native", working_size=working_size),
+                                  args.repeat, args.warmup)
+                stats["ab_l1_vs_source"] = ab_l1(native_result, img)
+                stats["ab_l1_vs_grid"] = ab_l1(native_result, grid_result)
+                stats["forward_passes"] = metrics["forward_passes"]
+                results[f"native_vs_grid/{res}px/native{working_size}"] = stats
+    finally:
+        backend.GRID_SIZE = original_grid
+
+
+def bench_decode(results, args):
+    """Upload decode to the L plane: grayscale-aware path vs the old full BGR decode + LAB conversion."""
+    for res in args.resolutions:
+        gray = cv2.cvtColor(synthetic_image(res, int(res * 4 / 3), seed=res), cv2.COLOR_BGR2GRAY)
+        for label, encoded in (("gray_jpeg", cv2.imencode(".jpg", gray)[1].tobytes()),
+                               ("gray_as_color_jpeg", cv2.imencode(".jpg", cv2.merge([gray, gray, gray]))[1].tobytes())):
+            buf = np.frombuffer(encoded, np.uint8)
+            results[f"decode/{res}px/{label}/bgr_lab"] = time_call(
+                lambda: cv2.cvtColor(cv2.imdecode(buf, cv2.IMREAD_COLOR), cv2.COLOR_BGR2LAB)[:, :, 0],
+                args.repeat, args.warmup)
+            results[f"decode/{res}px/{label}/l_plane"] = time_call(
+                lambda: decode_l_plane(encoded), args.repeat, args.warmup)
+
+
+def bench_refine(results, args):
+    res = max(args.resolutions)
+    img = synthetic_image(res, res, seed=11)
+    background, _ = backend.process_inference(img)
+    for stroke in args.stroke_sizes:
+        mask = stroke_mask(res, res, min(stroke, res))
+        results[f"process_refine/{res}px/stroke{stroke}"] = time_call(
+            lambda: backend.process_refine(img, mask, background.copy()), args.repeat, args.warmup)
+
+
+def bench_dataset(results, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        l_dir, ab_dir = os.path.join(tmp, "L"), os.path.join(tmp, "AB")
+        os.makedirs(l_dir)
+        os.makedirs(ab_dir)
+        rng = np.random.default_rng(0)
+        for i in range(args.dataset_samples):
+            np.save(os.path.join(l_dir, f"{i:06d}.npy"), rng.random((256, 256), dtype=np.float32))
+            np.save(os.path.join(ab_dir, f"{i:06d}.npy"), rng.normal(0, 20, (256, 256, 2)).astype(np.float32))
+
+        dataset = ColorizationDataset(split="train", train_ratio=1.0, val_ratio=0.0, l_path=l_dir, ab_path=ab_dir)
+        loader = torch.utils.data.DataLoader(dataset, batch_size=16, shuffle=False, num_workers=0)
+
+        def epoch():
+            for _ in loader:
+                pass
+
+        stats = time_call(epoch, args.repeat, args.warmup)
+        stats["per_sample_s"] = stats["median_s"] / len(dataset)
+        stats["samples_per_sec"] = len(dataset) / stats["median_s"]
+        results["dataset/epoch"] = stats
+
+
+def compare(results, baseline, tolerance):
+    """Returns (rows, regressions) comparing median times against the baseline."""
+    rows, regressions = [], []
+    for name, stats in results.items():
+        ref = baseline.get("results", {}).get(name)
+        if ref is None:
+            rows.append((name, stats["median_s"], None, None))
+            continue
+        ratio = stats["median_s"] / ref["median_s"]
+        rows.append((name, stats["median_s"], ref["median_s"], ratio))
+        if ratio > 1.0 + tolerance:
+            regressions.append(name)
+    return rows, regressions
+
+
+def comparison_report(rows, regressions, baseline_path, tolerance):
+    """The comparison as stored in the results JSON, so CI can read the verdict from the artifact."""
+    metrics = {}
+    for name, current, ref, ratio in rows:
+        metrics[name] = {
+            "median_s": current,
+            "baseline_median_s": ref,
+            "delta_s": None if ref is None else current - ref,
+            "ratio": ratio,
+            "regressed": name in regressions,
+        }
+    return {
+        "baseline": baseline_path,
+        "tolerance": tolerance,
+        "metrics": metrics,
+        "regressions": regressions,
+        "passed": not regressions,
+    }
+
+
+SUITES = {
+    "decode": bench_decode,
+    "forward": bench_forward,
+    "inference": bench_inference,
+    "native": bench_native,
+    "refine": bench_refine,
+    "dataset": bench_dataset,
+    "allocations": bench_allocations,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible CPU benchmarks for the colorization hot paths.")
+    parser.add_argument("--suites", nargs="+", choices=sorted(SUITES), default=list(SUITES))
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[256, 1024, 2048])
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[2, 3, 4, 6])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--working-sizes", type=int, nargs="+", default=[512, 1024],
+                        help="Native-mode working resolutions (long side) to compare against the grid.")
+    parser.add_argument("--stroke-sizes", type=int, nargs="+", default=[32, 128, 512])
+    parser.add_argument("--dataset-samples", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=4, help="torch intra-op threads (fixed for reproducibility).")
+    parser.add_argument("--output", type=str, default="results/benchmarks.json")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown vs baseline (0.15 = 15%%).")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="Exit 2 when there is no baseline to compare against (for CI).")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    torch.set_num_threads(args.threads)
+    cv2.setNumThreads(args.threads)
+    if backend.models.load() is None:
+        sys.exit(f"Could not load model: {backend.models.reason}")
+
+    results = {}
+    for suite in args.suites:
+        print(f"Running {suite} benchmarks...")
+        SUITES[suite](results, args)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "torch": torch.__version__,
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "threads": args.threads,
+            "model_path": backend.models.status()["checkpoint"] if backend.models.checkpoint_hash != "untrained" else None,
+            "checkpoint_sha256": backend.models.checkpoint_hash,
+        },
+        "results": results,
+    }
+
+    rows, regressions = None, []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        report["comparison"] = comparison_report(rows, regressions, args.baseline, args.tolerance)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if rows is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        sys.exit(2 if args.require_baseline else 0)
+
+    print("\n" + "=" * 78)
+    print(f"{'benchmark':<44}{'median':>10}{'baseline':>12}{'ratio':>10}")
+    print("=" * 78)
+    for name, current, ref, ratio in rows:
+        ref_str = f"{ref * 1000:.1f}ms" if ref is not None else "-"
+        ratio_str = f"{ratio:.2f}x" if ratio is not None else "new"
+        flag = "  <-- REGRESSION" if name in regressions else ""
+        print(f"{name:<44}{current * 1000:>8.1f}ms{ref_str:>12}{ratio_str:>10}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}.")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
-import torch
-checkpoint_path = 'model/finetuned/last_checkpoint.pth'
+import os
+from training.checkpoint import read_sidecar
+
+checkpoint_path = 'model/finetuned/last_checkpoint.safetensors'
+legacy_path = 'model/finetuned/last_checkpoint.pth'
 try:
-    checkpoint = torch.load(checkpoint_path, map_location='cpu')
-    print(f"RESUME_EPOCH: {checkpoint['epoch'] + 1}")
+    # The JSON sidecar holds the epoch; the weights and optimizer state are never opened
+    sidecar = read_sidecar(checkpoint_path)
+    if sidecar is None and os.path.exists(legacy_path):
+        import torch
+        sidecar = torch.load(legacy_path, map_location='cpu')
+    if sidecar is None:
+        raise FileNotFoundError(checkpoint_path)
+    print(f"RESUME_EPOCH: {sidecar['epoch'] + 1}")
 except Exception as e:
     print(f"ERROR: {e}")
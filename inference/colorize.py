@@ -10,6 +10,9 @@ import torch
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 try:
     from training.colorization_model import ColorizationNet
+    from training.checkpoint import load_weights, resolve_weights
+    from training.inference_context import InferenceContext
+    from training.native_inference import predict_native_ab, clip_working_size
 except ImportError:
     print("Error: Could not find training/colorization_model.py.")
     print("Make sure you are running this script from the project root.")
@@ -32,20 +35,22 @@ def apply_adaptive_stretch(a_pred, b_pred, vibrancy):
         b_pred *= target_boost
     return a_pred, b_pred
 
-def colorize_image(input_path, output_path, model_path, vibrancy=1.6, grid_size=3):
+def colorize_image(input_path, output_path, model_path, vibrancy=1.6, grid_size=3, mode="grid", working_size=1024):
     """
     Main function with High-Density Tiled Inference + Adaptive Stretching.
     grid_size=3 means a 3x3 grid (9 tiles), much more thorough than 2x2.
+    mode="native" replaces the global + tiled passes with a single forward at `working_size`.
     """
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Using device: {device}")
 
     # 1. Load Model
-    model = ColorizationNet()
-    if not os.path.exists(model_path):
+    model = ColorizationNet(pretrained=False)
+    if resolve_weights(model_path) is None:
         print(f"Error: Model not found at {model_path}")
         return
-    model.load_state_dict(torch.load(model_path, map_location=device))
+    state, _, _ = load_weights(model_path, verify=True)
+    model.load_state_dict(state)
     model.to(device).eval()
 
     # 2. Load Original Image
@@ -55,73 +60,82 @@ def colorize_image(input_path, output_path, model_path, vibrancy=1.6, grid_size=
     orig_lab = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2LAB)
     orig_l_channel = orig_lab[:, :, 0]
 
-    def run_model(img_np):
-        img_resized = cv2.resize(img_np, (256, 256))
-        l_chan = cv2.cvtColor(img_resized, cv2.COLOR_BGR2LAB)[:, :, 0]
-        l_norm = l_chan.astype(np.float32) / 255.0
-        l_tensor = torch.from_numpy(l_norm).unsqueeze(0).unsqueeze(0).to(device)
-        with torch.no_grad():
-            ab_pred = model(l_tensor).squeeze(0).cpu().numpy()
-        return ab_pred # (2, 256, 256)
-
-    # 3. GLOBAL PASS (The 'Baseline' colors)
-    print("Running Global Pass...")
-    ab_global = run_model(img_bgr)
-    a_global = cv2.resize(ab_global[0], (orig_w, orig_h), interpolation=cv2.INTER_CUBIC)
-    b_global = cv2.resize(ab_global[1], (orig_w, orig_h), interpolation=cv2.INTER_CUBIC)
-
-    # 4. HIGH-DENSITY TILED PASS
-    if grid_size > 1:
-        print(f"Running {grid_size}x{grid_size} Tiled Pass ({grid_size**2} units)...")
-        final_a = np.zeros((orig_h, orig_w), dtype=np.float32)
-        final_b = np.zeros((orig_h, orig_w), dtype=np.float32)
-        weight_sum = np.zeros((orig_h, orig_w), dtype=np.float32)
-
-        # Calculate stride and window size with 50% overlap for smoothness
-        # Each tile will cover roughly (1 / (grid_size - offset)) of the image
-        win_h = int(orig_h / (grid_size * 0.6)) if grid_size > 1 else orig_h
-        win_w = int(orig_w / (grid_size * 0.6)) if grid_size > 1 else orig_w
+    # One set of input/output buffers serves the global pass and every tile
+    context = InferenceContext(device, max_batch=1)
+
+    def run_model(l_plane):
+        context.load([l_plane])
+        return context.forward(model, 1)[0] # (2, 256, 256), overwritten by the next call
+
+    if mode == "native":
+        print(f"Running Native Pass (working size {working_size}px)...")
+        def forward(l_batch):
+            l_tensor = torch.from_numpy(l_batch).unsqueeze(1).to(device)
+            with torch.no_grad():
+                return model(l_tensor).cpu().numpy()
+
+        a_final, b_final, info = predict_native_ab(forward, orig_l_channel, clip_working_size(working_size, 1024))
+        if info["tiles"] > 1:
+            print(f"Native plane split into {info['tiles']} tiles ({info['forwards']} forward passes).")
+    else:
+        # 3. GLOBAL PASS (The 'Baseline' colors)
+        print("Running Global Pass...")
+        ab_global = run_model(orig_l_channel)
+        a_global = cv2.resize(ab_global[0], (orig_w, orig_h), interpolation=cv2.INTER_CUBIC)
+        b_global = cv2.resize(ab_global[1], (orig_w, orig_h), interpolation=cv2.INTER_CUBIC)
+
+        # 4. HIGH-DENSITY TILED PASS
+        if grid_size > 1:
+            print(f"Running {grid_size}x{grid_size} Tiled Pass ({grid_size**2} units)...")
+            final_a = np.zeros((orig_h, orig_w), dtype=np.float32)
+            final_b = np.zeros((orig_h, orig_w), dtype=np.float32)
+            weight_sum = np.zeros((orig_h, orig_w), dtype=np.float32)
+
+            # Calculate stride and window size with 50% overlap for smoothness
+            # Each tile will cover roughly (1 / (grid_size - offset)) of the image
+            win_h = int(orig_h / (grid_size * 0.6)) if grid_size > 1 else orig_h
+            win_w = int(orig_w / (grid_size * 0.6)) if grid_size > 1 else orig_w
         
-        # Ensure window isn't larger than original
-        win_h = min(win_h, orig_h)
-        win_w = min(win_w, orig_w)
-
-        # Pre-calculate soft weights for blending
-        mask = np.ones((win_h, win_w), dtype=np.float32)
-        border = 10
-        cv2.copyMakeBorder(mask[border:-border, border:-border], border, border, border, border, cv2.BORDER_CONSTANT, value=0)
-        mask = cv2.GaussianBlur(mask, (31, 31), 0)
-
-        y_coords = np.linspace(0, orig_h - win_h, grid_size).astype(int)
-        x_coords = np.linspace(0, orig_w - win_w, grid_size).astype(int)
-
-        for y1 in y_coords:
-            for x1 in x_coords:
-                y2, x2 = y1 + win_h, x1 + win_w
-                tile_img = img_bgr[y1:y2, x1:x2]
+            # Ensure window isn't larger than original
+            win_h = min(win_h, orig_h)
+            win_w = min(win_w, orig_w)
+
+            # Pre-calculate soft weights for blending
+            mask = np.ones((win_h, win_w), dtype=np.float32)
+            border = 10
+            cv2.copyMakeBorder(mask[border:-border, border:-border], border, border, border, border, cv2.BORDER_CONSTANT, value=0)
+            mask = cv2.GaussianBlur(mask, (31, 31), 0)
+
+            y_coords = np.linspace(0, orig_h - win_h, grid_size).astype(int)
+            x_coords = np.linspace(0, orig_w - win_w, grid_size).astype(int)
+
+            for y1 in y_coords:
+                for x1 in x_coords:
+                    y2, x2 = y1 + win_h, x1 + win_w
+                    tile_l = orig_l_channel[y1:y2, x1:x2]
                 
-                # Inference on tile
-                ab_tile = run_model(tile_img)
+                    # Inference on tile
+                    ab_tile = run_model(tile_l)
                 
-                # Upscale back to current tile window size
-                a_tile = cv2.resize(ab_tile[0], (win_w, win_h), interpolation=cv2.INTER_CUBIC)
-                b_tile = cv2.resize(ab_tile[1], (win_w, win_h), interpolation=cv2.INTER_CUBIC)
+                    # Upscale back to current tile window size
+                    a_tile = cv2.resize(ab_tile[0], (win_w, win_h), interpolation=cv2.INTER_CUBIC)
+                    b_tile = cv2.resize(ab_tile[1], (win_w, win_h), interpolation=cv2.INTER_CUBIC)
                 
-                # Accumulate with soft weights
-                final_a[y1:y2, x1:x2] += a_tile * mask
-                final_b[y1:y2, x1:x2] += b_tile * mask
-                weight_sum[y1:y2, x1:x2] += mask
-
-        # Blend tiled result with global pass
-        valid = weight_sum > 0
-        final_a[valid] /= (weight_sum[valid] + 1e-6)
-        final_b[valid] /= (weight_sum[valid] + 1e-6)
+                    # Accumulate with soft weights
+                    final_a[y1:y2, x1:x2] += a_tile * mask
+                    final_b[y1:y2, x1:x2] += b_tile * mask
+                    weight_sum[y1:y2, x1:x2] += mask
+
+            # Blend tiled result with global pass
+            valid = weight_sum > 0
+            final_a[valid] /= (weight_sum[valid] + 1e-6)
+            final_b[valid] /= (weight_sum[valid] + 1e-6)
         
-        # Final mix: 80% Dense Tiles (Details) + 20% Global (Stability)
-        a_final = final_a * 0.8 + a_global * 0.2
-        b_final = final_b * 0.8 + b_global * 0.2
-    else:
-        a_final, b_final = a_global, b_global
+            # Final mix: 80% Dense Tiles (Details) + 20% Global (Stability)
+            a_final = final_a * 0.8 + a_global * 0.2
+            b_final = final_b * 0.8 + b_global * 0.2
+        else:
+            a_final, b_final = a_global, b_global
 
     # 5. Adaptive Boost (The final 'Pop')
     a_final, b_final = apply_adaptive_stretch(a_final, b_final, vibrancy)
@@ -140,12 +154,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Pro Colorization with High-Density Tiling.")
     parser.add_argument("--input", type=str, required=True)
     parser.add_argument("--output", type=str, default="results/colorized.jpg")
-    parser.add_argument("--weights", type=str, default="model/finetuned/colorizer.pth")
+    parser.add_argument("--weights", type=str, default="model/finetuned/colorizer.safetensors",
+                        help="Weights (.safetensors, or a legacy .pth).")
     parser.add_argument("--vibrancy", type=float, default=1.8)
     parser.add_argument("--grid", type=int, default=3, help="Grid density (e.g., 3 for 3x3=9 units).")
+    parser.add_argument("--mode", type=str, default="grid", choices=["grid", "native"],
+                        help="'native' runs one forward at --working-size instead of global + tiled passes.")
+    parser.add_argument("--working-size", type=int, default=1024, help="Long side (px) for --mode native.")
 
     args = parser.parse_args()
-    colorize_image(args.input, args.output, args.weights, args.vibrancy, args.grid)
+    colorize_image(args.input, args.output, args.weights, args.vibrancy, args.grid, args.mode, args.working_size)
 
 # Example command:
 # python inference/colorize.py --input test.jpg --output results/test_vibrant.jpg --vibrancy 1.6
+# python inference/colorize.py --input scan.jpg --mode native --working-size 1536
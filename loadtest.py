@@ -0,0 +1,302 @@
+"""
+Load generator for the colorization API.
+
+Builds on verify_metrics.py's multipart helper, but keeps one keep-alive connection
+per worker thread and drives /colorize and /refine through a schedule of stages.
+
+Each stage is CONCURRENCY:SECONDS[:RATE], where RATE is a global requests/sec cap.
+Leave RATE out for closed-loop load, where every worker sends as fast as it gets answers.
+
+Examples:
+    python loadtest.py --spawn --stages 1:20 4:30 8:30
+    python loadtest.py --images samples/ --mix colorize=1,refine=3 --stages 8:60:5
+"""
+import os
+import sys
+import time
+import json
+import secrets
+import argparse
+import threading
+import subprocess
+import http.client
+
+import cv2
+import numpy as np
+
+from verify_metrics import create_multipart_body
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+def load_payloads(image_dir, limit):
+    """Returns a list of (filename, jpeg/png bytes, content_type, (h, w)) to replay."""
+    payloads = []
+    if image_dir:
+        for name in sorted(os.listdir(image_dir)):
+            ext = os.path.splitext(name)[1].lower()
+            if ext not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(image_dir, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                continue
+            content_type = "image/png" if ext == ".png" else "image/jpeg"
+            payloads.append((name, data, content_type, img.shape[:2]))
+            if limit and len(payloads) >= limit:
+                break
+        if not payloads:
+            sys.exit(f"No readable JPG/PNG images found in {image_dir}")
+    else:
+        # Same synthetic input as verify_metrics.py, at a more realistic size
+        img = np.full((768, 1024, 3), 90, dtype=np.uint8)
+        cv2.circle(img, (512, 384), 180, (0, 0, 255), -1)
+        _, buf = cv2.imencode(".jpg", img)
+        payloads.append(("synthetic.jpg", buf.tobytes(), "image/jpeg", img.shape[:2]))
+    return payloads
+
+
+def build_requests(payloads, stroke):
+    """Pre-encodes every request body once so the client never competes with the server for CPU."""
+    bodies = {"/colorize": [], "/refine": []}
+    for filename, data, content_type, (h, w) in payloads:
+        boundary = secrets.token_hex(16)
+        body = create_multipart_body({}, {"file": (filename, data, content_type)}, boundary)
+        bodies["/colorize"].append((body, boundary))
+
+        mask = np.zeros((h, w), dtype=np.uint8)
+        half = min(stroke, h, w) // 2
+        cv2.rectangle(mask, (w // 2 - half, h // 2 - half), (w // 2 + half, h // 2 + half), 255, -1)
+        _, mask_buf = cv2.imencode(".png", mask)
+        boundary = secrets.token_hex(16)
+        body = create_multipart_body({}, {
+            "file": (filename, data, content_type),
+            "mask": ("mask.png", mask_buf.tobytes(), "image/png"),
+        }, boundary)
+        bodies["/refine"].append((body, boundary))
+    return bodies
+
+
+def parse_mix(text):
+    """'colorize=1,refine=3' -> [('/colorize', 0.25), ('/refine', 0.75)]"""
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        weights["/" + name.strip().lstrip("/")] = float(weight or 1)
+    total = sum(weights.values())
+    return [(endpoint, w / total) for endpoint, w in weights.items() if w > 0]
+
+
+def parse_stage(text):
+    parts = text.split(":")
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"Stage must be CONCURRENCY:SECONDS[:RATE], got {text!r}")
+    concurrency, seconds = int(parts[0]), float(parts[1])
+    rate = float(parts[2]) if len(parts) == 3 else 0.0
+    return concurrency, seconds, rate
+
+
+class Pacer:
+    """Hands out evenly spaced send slots so all workers together stay at `rate` req/s."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.perf_counter()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        delay = slot - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Worker(threading.Thread):
+    """Sends requests over one persistent HTTP/1.1 connection until the stage deadline."""
+
+    def __init__(self, host, port, timeout, bodies, mix, pacer, deadline, seed):
+        super().__init__(daemon=True)
+        self.host, self.port, self.timeout = host, port, timeout
+        self.bodies, self.mix, self.pacer, self.deadline = bodies, mix, pacer, deadline
+        self.rng = np.random.default_rng(seed)
+        self.conn = None
+        self.records = []  # (endpoint, latency_s, ok)
+
+    def connect(self):
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def send(self, endpoint, body, boundary):
+        if self.conn is None:
+            self.connect()
+        headers = {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive",
+        }
+        self.conn.request("POST", endpoint, body, headers)
+        response = self.conn.getresponse()
+        response.read()  # Drain so the connection can be reused
+        if response.will_close:
+            self.conn.close()
+            self.conn = None
+        return response.status
+
+    def run(self):
+        endpoints = [e for e, _ in self.mix]
+        weights = [w for _, w in self.mix]
+        while True:
+            self.pacer.wait()
+            if time.perf_counter() >= self.deadline:
+                break
+            endpoint = endpoints[self.rng.choice(len(endpoints), p=weights)]
+            body, boundary = self.bodies[endpoint][self.rng.integers(len(self.bodies[endpoint]))]
+            start = time.perf_counter()
+            try:
+                status = self.send(endpoint, body, boundary)
+                ok = status == 200
+            except (OSError, http.client.HTTPException):
+                # Broken or timed-out connection: count it and reconnect on the next request
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                ok = False
+            self.records.append((endpoint, time.perf_counter() - start, ok))
+        if self.conn is not None:
+            self.conn.close()
+
+
+def summarize(records, elapsed):
+    """Aggregates latency records into throughput, error rate and percentile latencies (ms)."""
+    summary = {}
+    by_endpoint = {}
+    for endpoint, latency, ok in records:
+        by_endpoint.setdefault(endpoint, []).append((latency, ok))
+    by_endpoint["all"] = [(latency, ok) for _, latency, ok in records]
+
+    for endpoint, rows in by_endpoint.items():
+        latencies = np.array([latency for latency, ok in rows if ok]) * 1000.0
+        errors = sum(1 for _, ok in rows if not ok)
+        entry = {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": errors / len(rows) if rows else 0.0,
+            "throughput_rps": (len(rows) - errors) / elapsed if elapsed > 0 else 0.0,
+        }
+        if latencies.size:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            entry.update({"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+                          "mean_ms": float(latencies.mean())})
+        summary[endpoint] = entry
+    return summary
+
+
+def run_stage(args, bodies, mix, concurrency, seconds, rate, stage_idx):
+    pacer = Pacer(rate)
+    deadline = time.perf_counter() + seconds
+    workers = [Worker(args.host, args.port, args.timeout, bodies, mix, pacer, deadline, seed=stage_idx * 1000 + i)
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    records = [r for w in workers for r in w.records]
+    return summarize(records, elapsed), elapsed
+
+
+def wait_for_server(host, port, timeout):
+    """Polls /readyz until the model is loaded and warmed up."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/readyz")
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status == 200:
+                return True
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def spawn_server(args):
+    """Starts a local uvicorn instance on args.port and waits until it answers."""
+    cmd = [sys.executable, "-m", "uvicorn", "webapp.backend.main:app",
+           "--host", args.host, "--port", str(args.port), "--log-level", "warning"]
+    env = dict(os.environ)
+    if args.allow_untrained:
+        env["COLORIZE_ALLOW_UNTRAINED"] = "1"
+    print(f"Starting server: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, env=env)
+    if not wait_for_server(args.host, args.port, args.startup_timeout):
+        proc.terminate()
+        sys.exit("Server did not come up in time.")
+    return proc
+
+
+def print_stage(stage, concurrency, seconds, rate, summary):
+    rate_str = f"{rate:g} req/s cap" if rate else "closed loop"
+    print(f"\nStage {stage}: concurrency={concurrency}, {seconds:g}s, {rate_str}")
+    print(f"{'endpoint':<12}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for endpoint, s in summary.items():
+        print(f"{endpoint:<12}{s['requests']:>7}{s['error_rate'] * 100:>6.1f}%{s['throughput_rps']:>8.2f}"
+              f"{s.get('p50_ms', float('nan')):>8.0f}ms{s.get('p95_ms', float('nan')):>8.0f}ms"
+              f"{s.get('p99_ms', float('nan')):>8.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load generator for /colorize and /refine.")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--images", type=str, default=None, help="Directory of JPG/PNG images to replay.")
+    parser.add_argument("--limit", type=int, default=0, help="Use at most this many images (0 = all).")
+    parser.add_argument("--mix", type=str, default="colorize=1,refine=1", help="Endpoint weights.")
+    parser.add_argument("--stroke", type=int, default=64, help="Brush stroke size (px) for /refine masks.")
+    parser.add_argument("--stages", type=parse_stage, nargs="+", default=[(1, 10.0, 0.0), (4, 20.0, 0.0)],
+                        help="CONCURRENCY:SECONDS[:RATE] stages, run in order.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (s).")
+    parser.add_argument("--spawn", action="store_true", help="Start a local uvicorn instance for the run.")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--allow-untrained", action="store_true",
+                        help="Let the spawned server run without model weights (timing only).")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.images, args.limit)
+    bodies = build_requests(payloads, args.stroke)
+    mix = parse_mix(args.mix)
+    print(f"Loaded {len(payloads)} image(s); mix: {', '.join(f'{e}={w:.0%}' for e, w in mix)}")
+
+    server = spawn_server(args) if args.spawn else None
+    report = {"host": args.host, "port": args.port, "images": len(payloads), "stages": []}
+    try:
+        for idx, (concurrency, seconds, rate) in enumerate(args.stages, start=1):
+            summary, elapsed = run_stage(args, bodies, mix, concurrency, seconds, rate, idx)
+            print_stage(idx, concurrency, seconds, rate, summary)
+            report["stages"].append({"concurrency": concurrency, "seconds": elapsed, "rate": rate,
+                                     "summary": summary})
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Checkpoint I/O.
+
+Weights are written in the safetensors layout (8-byte little-endian header length,
+JSON header with dtype/shape/byte offsets per tensor, then the raw tensor bytes), so
+they can be memory-mapped instead of unpickled; `safetensors` and other tools read
+them as-is. Optimizer state goes to a separate file that only resuming training
+touches, and a small JSON sidecar carries the epoch, best validation loss, content
+hash and training config, so tools that only need those never open the weights.
+
+    colorizer.safetensors   weights
+    colorizer.json          sidecar
+    last_checkpoint.safetensors / .optim.pt / .json
+
+Convert a legacy pickled state dict:
+    python -m training.checkpoint convert model/finetuned/colorizer.pth
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import hashlib
+import argparse
+
+import torch
+
+WEIGHTS_EXT = ".safetensors"
+LEGACY_EXT = ".pth"
+
+_DTYPES = {
+    torch.float64: "F64", torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16",
+    torch.int64: "I64", torch.int32: "I32", torch.int16: "I16", torch.int8: "I8",
+    torch.uint8: "U8", torch.bool: "BOOL",
+}
+_DTYPES_BY_NAME = {name: dtype for dtype, name in _DTYPES.items()}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Streams a file through SHA-256 (checkpoints are too large to read in one go)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stem(path):
+    """'model/colorizer.safetensors' -> 'model/colorizer' (also for .pth and .json)."""
+    base, ext = os.path.splitext(path)
+    return base if ext in (WEIGHTS_EXT, LEGACY_EXT, ".json") else path
+
+
+def sidecar_path(path):
+    return stem(path) + ".json"
+
+
+def optimizer_path(path):
+    return stem(path) + ".optim.pt"
+
+
+def resolve_weights(path):
+    """The weights file to load for `path`: the .safetensors file if present, else a legacy .pth. None if neither."""
+    for candidate in (stem(path) + WEIGHTS_EXT, stem(path) + LEGACY_EXT):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_file(tensors, path, metadata=None):
+    """
+    Writes a {name: tensor} dict in the safetensors layout (atomically).
+    Returns the SHA-256 of the written file.
+    """
+    header, payloads, offset = {}, [], 0
+    for name in sorted(tensors):
+        tensor = tensors[name].detach().to("cpu").contiguous()
+        if tensor.dtype not in _DTYPES:
+            raise TypeError(f"{name}: unsupported dtype {tensor.dtype}")
+        data = tensor.reshape(-1).view(torch.uint8).numpy() if tensor.numel() else b""
+        nbytes = len(data) if isinstance(data, bytes) else data.nbytes
+        header[name] = {"dtype": _DTYPES[tensor.dtype], "shape": list(tensor.shape),
+                        "data_offsets": [offset, offset + nbytes]}
+        payloads.append(data)
+        offset += nbytes
+    if metadata:
+        header["__metadata__"] = {str(k): str(v) for k, v in metadata.items()}
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-len(header_bytes) % 8) # Keep the tensor data 8-byte aligned
+    digest = hashlib.sha256()
+
+    def write(f):
+        for chunk in (struct.pack("<Q", len(header_bytes)), header_bytes, *payloads):
+            chunk = memoryview(chunk).cast("B") if not isinstance(chunk, bytes) else chunk
+            digest.update(chunk)
+            f.write(chunk)
+
+    _atomic_write(path, write)
+    return digest.hexdigest()
+
+
+def read_header(path):
+    """Returns (header dict, data start offset) without touching the tensor bytes."""
+    with open(path, "rb") as f:
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+    return header, 8 + length
+
+
+def load_file(path, device="cpu"):
+    """
+    Loads a safetensors file as {name: tensor}. On CPU the tensors are views of a
+    private (copy-on-write) memory map, so loading costs no reads or copies up front
+    and pages are only pulled in as they are used.
+    """
+    header, start = read_header(path)
+    header.pop("__metadata__", None)
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if os.fstat(f.fileno()).st_size else b""
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = _DTYPES_BY_NAME[info["dtype"]]
+        begin, end = info["data_offsets"]
+        if end == begin:
+            tensor = torch.empty(info["shape"], dtype=dtype)
+        else:
+            tensor = torch.frombuffer(buffer, dtype=torch.uint8, count=end - begin, offset=start + begin)
+            tensor = tensor.view(dtype).reshape(info["shape"])
+        tensors[name] = tensor if str(device) == "cpu" else tensor.to(device)
+    return tensors
+
+
+def read_sidecar(path):
+    """Sidecar metadata for a checkpoint (any of its paths), or None if there is none."""
+    try:
+        with open(sidecar_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, model_state, optimizer_state=None, **meta):
+    """
+    Writes `<stem>.safetensors`, optionally `<stem>.optim.pt`, and the `<stem>.json` sidecar
+    (written last, so a sidecar always describes complete files). `meta` is stored in the
+    sidecar: typically epoch, best_val_loss and config. Returns the sidecar dict.
+    """
+    weights = stem(path) + WEIGHTS_EXT
+    start = time.perf_counter()
+    sha256 = save_file(model_state, weights, metadata={"format": "pt"})
+    sidecar = {"weights": os.path.basename(weights), "sha256": sha256, "created": time.time(), **meta}
+    if optimizer_state is not None:
+        _atomic_write(optimizer_path(path), lambda f: torch.save(optimizer_state, f))
+        sidecar["optimizer"] = os.path.basename(optimizer_path(path))
+    sidecar["save_seconds"] = round(time.perf_counter() - start, 3)
+    payload = json.dumps(sidecar, indent=2).encode()
+    _atomic_write(sidecar_path(path), lambda f: f.write(payload))
+    return sidecar
+
+
+def load_weights(path, device="cpu", verify=False):
+    """
+    Loads a model state dict: memory-mapped from .safetensors, or unpickled from a legacy .pth.
+    With verify=True the file is hashed and compared against the sidecar (ValueError on mismatch).
+    Returns: (state_dict, sidecar or None, resolved path)
+    """
+    resolved = resolve_weights(path)
+    if resolved is None:
+        raise FileNotFoundError(f"No {WEIGHTS_EXT} or {LEGACY_EXT} weights for {path}")
+    sidecar = read_sidecar(resolved)
+
+    if verify and sidecar and sidecar.get("sha256") and resolved.endswith(WEIGHTS_EXT):
+        actual = file_sha256(resolved)
+        if actual != sidecar["sha256"]:
+            raise ValueError(f"{resolved}: sha256 {actual[:12]} does not match sidecar {sidecar['sha256'][:12]}")
+
+    if resolved.endswith(WEIGHTS_EXT):
+        return load_file(resolved, device), sidecar, resolved
+    return torch.load(resolved, map_location=device), sidecar, resolved
+
+
+def load_optimizer_state(path, device="cpu"):
+    """Optimizer (and scaler) state saved next to a checkpoint, or None."""
+    if not os.path.exists(optimizer_path(path)):
+        return None
+    return torch.load(optimizer_path(path), map_location=device)
+
+
+def convert(path):
+    """Rewrites a legacy pickled state dict (or training checkpoint) in the new layout."""
+    legacy = torch.load(path, map_location="cpu")
+    if "model_state_dict" in legacy:
+        sidecar = save_checkpoint(path, legacy["model_state_dict"], legacy.get("optimizer_state_dict"),
+                                  epoch=legacy.get("epoch"), best_val_loss=legacy.get("best_val_loss"),
+                                  converted_from=os.path.basename(path))
+    else:
+        sidecar = save_checkpoint(path, legacy, converted_from=os.path.basename(path))
+    print(f"Wrote {stem(path)}{WEIGHTS_EXT} (sha256 {sidecar['sha256'][:12]}) and {sidecar_path(path)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("convert", help="Convert a legacy .pth file.").add_argument("path")
+    sub.add_parser("info", help="Print a checkpoint's sidecar.").add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.path)
+    else:
+        sidecar = read_sidecar(args.path)
+        if sidecar is None:
+            sys.exit(f"No sidecar for {args.path}")
+        print(json.dumps(sidecar, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Background checkpoint writer for train.py.
+
+save() copies the model and optimizer state to CPU memory (the only part that blocks
+training) and hands the copy to a writer thread, which writes it with
+checkpoint.save_checkpoint (atomic per file, sidecar last). One write is in flight at a
+time: a save that arrives while the previous one is still writing waits for it, and that
+wait is counted as overhead too.
+
+Step checkpoints go to <save_dir>/checkpoints/step_<global step>.* and only the `keep`
+newest are kept. Their sidecars carry the epoch, the number of batches already done in
+it and the sampler seed, so training can resume mid-epoch.
+"""
+import os
+import glob
+import time
+import queue
+import threading
+
+import torch
+
+from checkpoint import save_checkpoint, read_sidecar, stem, WEIGHTS_EXT, sidecar_path, optimizer_path
+
+
+def snapshot(state):
+    """Deep CPU copy of a (nested) state dict, so training can keep updating the live tensors."""
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return state
+
+
+def resume_position(sidecar):
+    """(epoch, batches done) a checkpoint resumes from: mid-epoch if it has a step, else the next epoch."""
+    if sidecar.get("step") is not None:
+        return sidecar["epoch"], sidecar["step"]
+    return sidecar["epoch"] + 1, 0
+
+
+def latest_step_checkpoint(directory):
+    """(path, sidecar) of the newest step checkpoint in `directory`, or (None, None)."""
+    for path in sorted(glob.glob(os.path.join(directory, "step_*.json")), reverse=True):
+        sidecar = read_sidecar(path)
+        if sidecar is not None:
+            return stem(path) + WEIGHTS_EXT, sidecar
+    return None, None
+
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread; tracks what that costs the training loop."""
+
+    def __init__(self, step_dir, keep=3):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.step_dir = step_dir
+        self.keep = keep
+        self.saves = 0
+        self.blocking_seconds = 0.0 # Snapshot + waiting for the previous write: what training pays
+        self.write_seconds = 0.0    # Time the writer thread spent on disk
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, path, model, optimizer_state=None, prune=False, **meta):
+        """
+        Snapshots `model` (a module or state dict) and `optimizer_state`, then queues the write.
+        Returns the seconds training was blocked.
+        """
+        self._raise_error()
+        start = time.perf_counter()
+        self._queue.join() # Waits while the previous checkpoint is still being written
+        model_state = model.state_dict() if isinstance(model, torch.nn.Module) else model
+        self._queue.put((path, snapshot(model_state), snapshot(optimizer_state), prune, meta))
+        blocked = time.perf_counter() - start
+        self.blocking_seconds += blocked
+        self.saves += 1
+        return blocked
+
+    def save_step(self, global_step, model, optimizer_state, **meta):
+        """Rolling mid-epoch checkpoint; the oldest beyond `keep` are deleted once it is written."""
+        path = os.path.join(self.step_dir, f"step_{global_step:09d}{WEIGHTS_EXT}")
+        return self.save(path, model, optimizer_state, prune=True, global_step=global_step, **meta)
+
+    def close(self):
+        """Waits for queued writes to finish (call before exiting)."""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def summary(self, elapsed=None):
+        text = (f"{self.saves} saves, training blocked {self.blocking_seconds:.2f}s"
+                f", background writes {self.write_seconds:.2f}s")
+        if elapsed:
+            text += f" ({self.blocking_seconds / elapsed:.2%} of {elapsed:.0f}s)"
+        return text
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("background checkpoint write failed") from error
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            path, model_state, optimizer_state, prune, meta = job
+            start = time.perf_counter()
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                save_checkpoint(path, model_state, optimizer_state, **meta)
+                if prune:
+                    self._prune()
+            except Exception as e:
+                self._error = e
+            self.write_seconds += time.perf_counter() - start
+            self._queue.task_done()
+
+    def _prune(self):
+        sidecars = sorted(glob.glob(os.path.join(self.step_dir, "step_*.json")))
+        for old in sidecars[:-self.keep]:
+            # Sidecar first: a checkpoint without one is never picked up for resuming
+            for path in (sidecar_path(old), stem(old) + WEIGHTS_EXT, optimizer_path(old)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
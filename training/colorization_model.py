@@ -3,12 +3,14 @@ import torch.nn as nn
 import torchvision.models as models
 
 class ColorizationNet(nn.Module):
-    def __init__(self, input_size=128):
+    def __init__(self, input_size=128, pretrained=True):
         super(ColorizationNet, self).__init__()
         
         # 1. Load Pretrained ResNet18
-        # We start with a model pre-trained on ImageNet to leverage "world knowledge"
-        resnet = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
+        # We start with a model pre-trained on ImageNet to leverage "world knowledge".
+        # Pass pretrained=False when a full checkpoint is loaded right after (skips the download).
+        weights = models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None
+        resnet = models.resnet18(weights=weights)
         
         # 2. Encoder: Remove the last two layers (AvgPool and FC)
         # ResNet18 downsamples by factor of 32 (2^5)
@@ -1,7 +1,7 @@
 import os
 import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Sampler
 
 # Define paths relative to the project root
 L_PATH = r"data/processed/train/L"
@@ -12,13 +12,16 @@ class ColorizationDataset(Dataset):
     Custom PyTorch Dataset for LAB colorization.
     Loads L (grayscale) as input and AB (color) as target.
     """
-    def __init__(self, split="train", train_ratio=0.8, val_ratio=0.1):
+    def __init__(self, split="train", train_ratio=0.8, val_ratio=0.1, l_path=L_PATH, ab_path=AB_PATH):
+        self.l_path = l_path
+        self.ab_path = ab_path
+
         # List all files and ensure they are sorted to maintain alignment
         try:
-            self.l_files = sorted([f for f in os.listdir(L_PATH) if f.endswith('.npy')])
-            self.ab_files = sorted([f for f in os.listdir(AB_PATH) if f.endswith('.npy')])
+            self.l_files = sorted([f for f in os.listdir(l_path) if f.endswith('.npy')])
+            self.ab_files = sorted([f for f in os.listdir(ab_path) if f.endswith('.npy')])
         except FileNotFoundError:
-            print(f"Error: Could not find processed data in {L_PATH} or {AB_PATH}.")
+            print(f"Error: Could not find processed data in {l_path} or {ab_path}.")
             self.l_files = []
             self.ab_files = []
 
@@ -48,8 +51,8 @@ class ColorizationDataset(Dataset):
         real_idx = self.indices[idx]
 
         # Load the pre-processed NumPy arrays
-        l = np.load(os.path.join(L_PATH, self.l_files[real_idx]))
-        ab = np.load(os.path.join(AB_PATH, self.ab_files[real_idx]))
+        l = np.load(os.path.join(self.l_path, self.l_files[real_idx]))
+        ab = np.load(os.path.join(self.ab_path, self.ab_files[real_idx]))
 
         # Convert to PyTorch tensors
         # L shape: (H, W) -> (1, H, W)
@@ -59,3 +62,29 @@ class ColorizationDataset(Dataset):
         ab_tensor = torch.from_numpy(ab).permute(2, 0, 1).float()
 
         return l_tensor, ab_tensor
+
+
+class ResumableRandomSampler(Sampler):
+    """
+    Shuffling sampler whose order is a function of (seed, epoch), so a checkpoint only
+    needs those two numbers plus how many samples were consumed to resume mid-epoch.
+    """
+    def __init__(self, data_source, seed=0):
+        self.data_source = data_source
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch, start=0):
+        """Selects the epoch's permutation and skips its first `start` samples."""
+        self.epoch = epoch
+        self.start = start
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        order = torch.randperm(len(self.data_source), generator=generator)
+        return iter(order[self.start:].tolist())
+
+    def __len__(self):
+        return max(len(self.data_source) - self.start, 0)
@@ -0,0 +1,230 @@
+"""
+Perceptual-hash deduplication for prepare_dataset.py.
+
+Every source image gets a 64-bit DCT hash (pHash) of its downscaled luminance. Hashes
+go into a BK-tree, so "is there anything within N bits of this?" touches only a small
+part of the index. The index is stored as JSON next to the processed data:
+
+    {"version": 1, "threshold": 6, "next_id": 1234,
+     "files": {"data/raw/a.jpg": {"size": ..., "mtime": ..., "hash": "9f3a...",
+                                  "id": 17, "duplicate_of": null}, ...}}
+
+"id" is the output file number (000017.npy) for kept images; near-duplicates have
+"duplicate_of" set to the kept source they matched instead. Archive members are keyed
+"data/raw/set.tar::dir/b.jpg" and their entries also carry "archive" and "member".
+An incremental run only hashes files that are new or whose size/mtime changed.
+"""
+import os
+import json
+
+import cv2
+import numpy as np
+
+INDEX_VERSION = 1
+HASH_SIZE = 8        # 8x8 low-frequency DCT block -> 64-bit hash
+SAMPLE_SIZE = 32     # Luminance is downscaled to 32x32 before the DCT
+DEFAULT_THRESHOLD = 6 # Max Hamming distance (of 64 bits) still counted as a near-duplicate
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def phash(gray):
+    """64-bit perceptual hash of a grayscale image (any size, uint8 or float)."""
+    small = cv2.resize(gray, (SAMPLE_SIZE, SAMPLE_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # Median of the AC terms; the DC term only carries overall brightness
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def decode(source, flags=cv2.IMREAD_COLOR):
+    """cv2.imread for a path, cv2.imdecode for encoded bytes (or a uint8 buffer). None if unreadable."""
+    if isinstance(source, str):
+        return cv2.imread(source, flags)
+    return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flags)
+
+
+def read_for_hash(source):
+    """
+    (grayscale, scale) with the image at 1/`scale` per side, or (None, 1) if it cannot be read.
+    `source` is a path or the encoded bytes. JPEGs decode much faster reduced (scale 4).
+    Small images are decoded in full, since a reduced decode close to SAMPLE_SIZE hashes
+    differently from a larger copy.
+    """
+    img = decode(source, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is not None and min(img.shape[:2]) >= 4 * SAMPLE_SIZE:
+        return img, 4
+    return decode(source, cv2.IMREAD_GRAYSCALE), 1
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance. Nodes are [hash, item, {distance: child}]."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """All (distance, hash, item) within max_distance of value, nearest first."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0], node[1]))
+            # Triangle inequality: only children in [d - max, d + max] can match
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found, key=lambda match: match[0])
+
+
+class DedupIndex:
+    """
+    Persistent source-file -> hash/output record plus a BK-tree over the kept images.
+
+    The tree has no removal: when a kept source changes or turns into a duplicate, its old
+    node stays behind and match() skips it (the node no longer matches a kept entry). The
+    tree is rebuilt once such stale nodes make up a quarter of it. The duplicates that
+    pointed at a changed source are dropped from the index (`orphans`), so they are read
+    and matched again.
+    """
+
+    def __init__(self, path, threshold=DEFAULT_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.files = {}
+        self.next_id = 0
+        self.tree = BKTree()
+        self.stale = 0       # Tree nodes whose source changed or is no longer kept
+        self.orphans = set() # Duplicates of a changed source, not re-read yet
+
+    @classmethod
+    def load(cls, path, threshold=DEFAULT_THRESHOLD, output_exists=None):
+        """
+        Reads the index at `path` (empty if missing). Kept entries whose output no longer
+        exists (output_exists(id) is False) are dropped, so those files are converted again.
+        """
+        index = cls(path, threshold)
+        if not os.path.exists(path):
+            return index
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            return index
+
+        index.next_id = data.get("next_id", 0)
+        for source, entry in data.get("files", {}).items():
+            if entry.get("duplicate_of") is None and output_exists is not None and not output_exists(entry["id"]):
+                continue
+            index.files[source] = entry
+        index.rebuild_tree()
+        return index
+
+    def rebuild_tree(self):
+        self.tree = BKTree()
+        self.stale = 0
+        for source, entry in self.files.items():
+            if entry.get("duplicate_of") is None:
+                self.tree.add(int(entry["hash"], 16), source)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": INDEX_VERSION, "threshold": self.threshold,
+                       "next_id": self.next_id, "files": self.files}, f)
+        os.replace(tmp, self.path)
+
+    def is_known(self, source, stat=None):
+        """
+        True if `source` was indexed before and has not changed since. `stat` is its
+        (size, mtime), read from disk if omitted (archive members must pass it).
+        """
+        entry = self.files.get(source)
+        if entry is None:
+            return False
+        size, mtime = stat or _stat(source)
+        return entry["size"] == size and entry["mtime"] == mtime
+
+    def match(self, value, exclude=None):
+        """(kept source, distance) nearest to `value` within the threshold, or None."""
+        for distance, node_hash, source in self.tree.search(value, self.threshold):
+            entry = self.files.get(source)
+            live = entry is not None and entry.get("duplicate_of") is None and entry["hash"] == f"{node_hash:016x}"
+            if live and source != exclude:
+                return source, distance
+        return None
+
+    def add(self, source, value, duplicate_of=None, stat=None, archive=None, member=None):
+        """
+        Records `source` and returns its output id (None for a duplicate). A changed file
+        that was kept before keeps its id, so its outputs are overwritten in place; if its
+        hash changed, the duplicates recorded against it become `orphans`.
+        `stat` is as for is_known(); `archive`/`member` give an archive member's provenance.
+        """
+        size, mtime = stat or _stat(source)
+        previous = self.files.get(source) or {}
+        entry = {"size": size, "mtime": mtime, "hash": f"{value:016x}",
+                 "id": None, "duplicate_of": duplicate_of}
+        if archive is not None:
+            entry["archive"], entry["member"] = archive, member
+        was_kept = bool(previous) and previous.get("duplicate_of") is None
+        if was_kept and (duplicate_of is not None or previous["hash"] != entry["hash"]):
+            self.stale += 1
+            self._orphan_duplicates_of(source)
+        if duplicate_of is None:
+            if previous.get("id") is not None:
+                entry["id"] = previous["id"]
+            else:
+                entry["id"] = self.next_id
+                self.next_id += 1
+            if not (was_kept and previous["hash"] == entry["hash"]):
+                self.tree.add(value, source)
+        self.files[source] = entry
+        self.orphans.discard(source)
+        if self.stale > max(64, self.tree.size // 4):
+            self.rebuild_tree()
+        return entry["id"]
+
+    def _orphan_duplicates_of(self, source):
+        """Forgets the duplicates matched against `source`'s old content, so they are checked again."""
+        dependents = [other for other, entry in self.files.items() if entry.get("duplicate_of") == source]
+        for other in dependents:
+            del self.files[other]
+        self.orphans.update(dependents)
+
+    def take_orphans(self):
+        """Sources orphaned since the last call and not re-added yet."""
+        orphans, self.orphans = self.orphans, set()
+        return orphans
+
+    def manifest(self):
+        """Kept images by output id, with where each came from."""
+        kept = [(entry["id"], source, entry) for source, entry in self.files.items()
+                if entry.get("duplicate_of") is None]
+        return [{"id": img_id, "source": source, "archive": entry.get("archive"),
+                 "member": entry.get("member"), "hash": entry["hash"]}
+                for img_id, source, entry in sorted(kept, key=lambda item: item[0])]
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
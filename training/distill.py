@@ -0,0 +1,194 @@
+"""
+Knowledge distillation: trains StudentColorizationNet to imitate the trained ColorizationNet.
+
+The teacher runs frozen, in eval mode, on the same batches. The student minimizes
+    alpha * L1(student, teacher) + (1 - alpha) * L1(student, ground truth)
+so it learns the teacher's color choices while staying anchored to real colors.
+After training (or with --report-only) both models are timed at the served batch shapes
+and scored on the validation split. The comparison is written to --report.
+
+Run from the project root:
+    python training/distill.py --epochs 10
+    python training/distill.py --report-only
+"""
+import os
+import json
+import time
+import argparse
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from dataset import ColorizationDataset
+from colorization_model import ColorizationNet
+from student_model import StudentColorizationNet
+from checkpoint import save_checkpoint, load_weights, load_optimizer_state, read_sidecar, resolve_weights
+from train import validate, DEVICE, BATCH_SIZE
+
+TEACHER_PATH = "model/finetuned/colorizer.safetensors"
+SAVE_DIR = "model/student"
+LEARNING_RATE = 3e-4     # Student is trained end to end (encoder included), from ImageNet features
+ALPHA = 0.7              # Weight of the teacher term in the loss
+
+def load_teacher(path):
+    teacher = ColorizationNet(pretrained=False)
+    state, sidecar, _ = load_weights(path, device=DEVICE, verify=True)
+    teacher.load_state_dict(state)
+    teacher.to(DEVICE).eval()
+    for param in teacher.parameters():
+        param.requires_grad = False
+    return teacher, (sidecar or {}).get("sha256")
+
+def distill_one_epoch(student, teacher, loader, criterion, optimizer, scaler, alpha):
+    """One epoch of student training against teacher outputs and ground truth."""
+    student.train()
+    running_loss = 0.0
+    loop = tqdm(loader, desc="Distilling", leave=True)
+
+    for l_input, ab_target in loop:
+        l_input = l_input.to(DEVICE)
+        ab_target = ab_target.to(DEVICE)
+
+        optimizer.zero_grad()
+        with torch.cuda.amp.autocast(enabled=(DEVICE=="cuda")):
+            with torch.no_grad():
+                ab_teacher = teacher(l_input)
+            ab_student = student(l_input)
+            loss = alpha * criterion(ab_student, ab_teacher) + (1.0 - alpha) * criterion(ab_student, ab_target)
+
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+
+        running_loss += loss.item()
+        loop.set_postfix(loss=loss.item())
+
+    return running_loss / len(loader)
+
+def agreement(student, teacher, loader):
+    """Mean L1 between student and teacher outputs (how closely the student imitates)."""
+    student.eval()
+    total, batches = 0.0, 0
+    with torch.no_grad():
+        for l_input, _ in tqdm(loader, desc="Agreement", leave=False):
+            l_input = l_input.to(DEVICE)
+            total += (student(l_input) - teacher(l_input)).abs().mean().item()
+            batches += 1
+    return total / max(batches, 1)
+
+def time_model(model, batch_size, size=256, repeat=20, warmup=3):
+    """Median forward latency (ms) at a served batch shape."""
+    model.eval()
+    dummy = torch.zeros((batch_size, 1, size, size), device=DEVICE)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + repeat):
+            start = time.perf_counter()
+            model(dummy)
+            if DEVICE == "cuda":
+                torch.cuda.synchronize()
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000.0)
+    return sorted(timings)[len(timings) // 2]
+
+def speed_quality_report(student, teacher, val_loader, path):
+    criterion = nn.L1Loss()
+    report = {"device": DEVICE, "models": {}}
+    for name, model in (("teacher", teacher), ("student", student)):
+        report["models"][name] = {
+            "parameters_m": sum(p.numel() for p in model.parameters()) / 1e6,
+            "latency_ms": {f"batch{b}": time_model(model, b) for b in (1, 8)},
+            "val_l1": validate(model, val_loader, criterion) if len(val_loader) else None,
+        }
+    report["student_teacher_l1"] = agreement(student, teacher, val_loader) if len(val_loader) else None
+    teacher_ms = report["models"]["teacher"]["latency_ms"]["batch8"]
+    report["speedup_batch8"] = teacher_ms / report["models"]["student"]["latency_ms"]["batch8"]
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'model':<10}{'params':>9}{'b1 ms':>9}{'b8 ms':>9}{'val L1':>9}")
+    for name, row in report["models"].items():
+        val = f"{row['val_l1']:.4f}" if row["val_l1"] is not None else "n/a"
+        print(f"{name:<10}{row['parameters_m']:>8.2f}M{row['latency_ms']['batch1']:>9.1f}"
+              f"{row['latency_ms']['batch8']:>9.1f}{val:>9}")
+    print(f"Speed-up at batch 8: {report['speedup_batch8']:.1f}x | student vs teacher L1: {report['student_teacher_l1']}")
+    print(f"Report written to {path}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill ColorizationNet into StudentColorizationNet.")
+    parser.add_argument("--teacher", type=str, default=TEACHER_PATH)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--report", type=str, default="results/distill_report.json")
+    parser.add_argument("--report-only", action="store_true", help="Skip training; compare the saved student.")
+    args = parser.parse_args()
+
+    print(f"Using device: {DEVICE}")
+    teacher, teacher_sha = load_teacher(args.teacher)
+
+    train_dataset = ColorizationDataset(split="train")
+    val_dataset = ColorizationDataset(split="val")
+    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=2, pin_memory=True)
+    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=2, pin_memory=True)
+
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    checkpoint_path = os.path.join(SAVE_DIR, "last_checkpoint.safetensors")
+    best_model_path = os.path.join(SAVE_DIR, "student.safetensors")
+
+    if args.report_only:
+        if resolve_weights(best_model_path) is None:
+            raise SystemExit(f"No student weights at {best_model_path}")
+        student = StudentColorizationNet(pretrained=False)
+        student.load_state_dict(load_weights(best_model_path, device=DEVICE)[0])
+        speed_quality_report(student.to(DEVICE), teacher, val_loader, args.report)
+        return
+
+    student = StudentColorizationNet().to(DEVICE)
+    criterion = nn.L1Loss()
+    optimizer = optim.Adam(student.parameters(), lr=LEARNING_RATE)
+    scaler = torch.cuda.amp.GradScaler(enabled=(DEVICE=="cuda"))
+    config = {"batch_size": BATCH_SIZE, "learning_rate": LEARNING_RATE, "num_epochs": args.epochs,
+              "alpha": args.alpha, "architecture": "StudentColorizationNet", "teacher_sha256": teacher_sha}
+
+    start_epoch = 0
+    best_val_loss = float("inf")
+    sidecar = read_sidecar(checkpoint_path)
+    if sidecar is not None:
+        print(f"Found checkpoint at {checkpoint_path}. Resuming...")
+        student.load_state_dict(load_weights(checkpoint_path, device=DEVICE)[0])
+        optim_state = load_optimizer_state(checkpoint_path, device=DEVICE)
+        if optim_state is not None:
+            optimizer.load_state_dict(optim_state['optimizer'])
+            scaler.load_state_dict(optim_state['scaler'])
+        start_epoch = sidecar['epoch'] + 1
+        best_val_loss = sidecar['best_val_loss']
+
+    for epoch in range(start_epoch, args.epochs):
+        print(f"\nEpoch {epoch+1}/{args.epochs}")
+        train_loss = distill_one_epoch(student, teacher, train_loader, criterion, optimizer, scaler, args.alpha)
+        val_loss = validate(student, val_loader, criterion)
+        print(f"Result: Distill Loss: {train_loss:.5f} | Val L1 (ground truth): {val_loss:.5f}")
+
+        if val_loss < best_val_loss:
+            best_val_loss = val_loss
+            save_checkpoint(best_model_path, student.state_dict(), epoch=epoch, val_loss=val_loss,
+                            best_val_loss=best_val_loss, config=config)
+            print(f"--> New best student saved to {best_model_path} 🟢")
+
+        save_checkpoint(checkpoint_path, student.state_dict(),
+                        {'optimizer': optimizer.state_dict(), 'scaler': scaler.state_dict()},
+                        epoch=epoch, train_loss=train_loss, val_loss=val_loss,
+                        best_val_loss=best_val_loss, config=config)
+
+    if resolve_weights(best_model_path) is not None:
+        student.load_state_dict(load_weights(best_model_path, device=DEVICE)[0])
+    speed_quality_report(student, teacher, val_loader, args.report)
+
+if __name__ == "__main__":
+    main()
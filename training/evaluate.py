@@ -0,0 +1,216 @@
+"""
+Offline evaluation on the held-out test split.
+
+Streams the "test" split of ColorizationDataset in large no-grad batches and scores
+every image against its ground truth. PSNR and SSIM are computed on sRGB, AB L1 in LAB
+units, and colorfulness uses the backend's color-strength scale (mean |A| + |B|, 0-100).
+Metrics are computed per batch as tensor ops.
+
+Two sources of predictions:
+    model     the raw network output (fast; what train.py's validation loss sees)
+    pipeline  the served result: grid/native passes, 80/20 mix and adaptive stretch
+
+Run from the project root:
+    python training/evaluate.py
+    python training/evaluate.py --pipeline --mode native --output results/eval/native
+Writes per_image.csv and summary.json to --output.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from training.dataset import ColorizationDataset
+from training.colorization_model import ColorizationNet
+from training.checkpoint import load_weights
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+METRICS = ("psnr", "ssim", "ab_l1", "colorfulness", "colorfulness_gt")
+
+# sRGB (D65) from linear XYZ
+_XYZ_TO_RGB = torch.tensor([[3.2404542, -1.5371385, -0.4985314],
+                            [-0.9692660, 1.8760108, 0.0415560],
+                            [0.0556434, -0.2040259, 1.0572252]])
+_WHITE = torch.tensor([0.950456, 1.0, 1.088754]) # D65, as used by OpenCV
+
+
+def lab_to_rgb(l, ab):
+    """
+    CIELAB -> sRGB in [0, 1] for a batch. `l` is the dataset's L/255 scale (B, 1, H, W),
+    `ab` is in LAB units (B, 2, H, W), matching prepare_dataset.py.
+    """
+    L = l * 100.0 # Dataset L is OpenCV's 8-bit L (L* x 255/100) divided by 255
+    fy = (L + 16.0) / 116.0
+    fx = fy + ab[:, 0:1] / 500.0
+    fz = fy - ab[:, 1:2] / 200.0
+    f = torch.cat([fx, fy, fz], dim=1)
+    xyz = torch.where(f > 6.0 / 29.0, f ** 3, (f - 4.0 / 29.0) * (3.0 * (6.0 / 29.0) ** 2))
+    xyz = xyz * _WHITE.to(l.device).view(1, 3, 1, 1)
+    rgb = torch.einsum("ij,bjhw->bihw", _XYZ_TO_RGB.to(l.device), xyz).clamp(0.0, 1.0)
+    return torch.where(rgb > 0.0031308, 1.055 * rgb.clamp(min=1e-8) ** (1.0 / 2.4) - 0.055, 12.92 * rgb)
+
+
+def _gaussian_window(size=11, sigma=1.5, channels=3, device="cpu"):
+    coords = torch.arange(size, dtype=torch.float32, device=device) - size // 2
+    g = torch.exp(-(coords ** 2) / (2 * sigma ** 2))
+    g = g / g.sum()
+    return (g[:, None] * g[None, :]).expand(channels, 1, size, size).contiguous()
+
+
+def ssim(x, y, window=None):
+    """Per-image mean SSIM over channels for images in [0, 1] (B, C, H, W) -> (B,)."""
+    channels = x.shape[1]
+    window = _gaussian_window(channels=channels, device=x.device) if window is None else window
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    mu_x = F.conv2d(x, window, groups=channels)
+    mu_y = F.conv2d(y, window, groups=channels)
+    sigma_x = F.conv2d(x * x, window, groups=channels) - mu_x ** 2
+    sigma_y = F.conv2d(y * y, window, groups=channels) - mu_y ** 2
+    sigma_xy = F.conv2d(x * y, window, groups=channels) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (sigma_x + sigma_y + c2))
+    return ssim_map.flatten(1).mean(dim=1)
+
+
+def psnr(x, y):
+    """Per-image PSNR (dB) for images in [0, 1] (B, C, H, W) -> (B,)."""
+    mse = ((x - y) ** 2).flatten(1).mean(dim=1)
+    return 10.0 * torch.log10(1.0 / mse.clamp(min=1e-10))
+
+
+def color_strength(ab):
+    """Batched calculate_color_energy: mean(|A| + |B|) / 64 * 100, clipped to 0-100 -> (B,)."""
+    return (ab.abs().sum(dim=1).flatten(1).mean(dim=1) / 64.0 * 100.0).clamp(0.0, 100.0)
+
+
+def batch_metrics(l, ab_pred, ab_true):
+    """All metrics for one batch, as {name: (B,) tensor}."""
+    rgb_pred, rgb_true = lab_to_rgb(l, ab_pred), lab_to_rgb(l, ab_true)
+    return {
+        "psnr": psnr(rgb_pred, rgb_true),
+        "ssim": ssim(rgb_pred, rgb_true),
+        "ab_l1": (ab_pred - ab_true).abs().flatten(1).mean(dim=1),
+        "colorfulness": color_strength(ab_pred),
+        "colorfulness_gt": color_strength(ab_true),
+    }
+
+
+def model_predictor(weights):
+    model = ColorizationNet(pretrained=False)
+    state, _, _ = load_weights(weights)
+    model.load_state_dict(state)
+    model.to(DEVICE).eval()
+
+    def predict(l):
+        with torch.cuda.amp.autocast(enabled=(DEVICE == "cuda")):
+            return model(l).float()
+    return predict
+
+
+def pipeline_predictor(weights, mode, adaptive, vibrancy):
+    """Runs each image through the backend's served path and reads the AB channels back from the output."""
+    from webapp.backend import main as backend
+    from webapp.backend.lifecycle import ModelManager
+
+    backend.models = ModelManager(weights, backend.DEVICE)
+    if backend.models.load() is None:
+        sys.exit(f"Could not load {weights}: {backend.models.reason}")
+
+    def predict(l):
+        planes = (l[:, 0].cpu().numpy() * 255.0).round().astype(np.uint8)
+        out = []
+        for plane in planes:
+            raw = backend.predict_planes(plane, adaptive=adaptive, mode=mode)
+            result_bgr, _ = backend.render_planes(raw, vibrancy)
+            lab = cv2.cvtColor(result_bgr, cv2.COLOR_BGR2LAB)
+            out.append(lab[:, :, 1:].astype(np.float32) - 128.0)
+        return torch.from_numpy(np.stack(out)).permute(0, 3, 1, 2).to(l.device)
+    return predict
+
+
+def summarize(columns):
+    summary = {}
+    for name in METRICS:
+        values = np.asarray(columns[name], dtype=np.float64)
+        summary[name] = {"mean": float(values.mean()), "median": float(np.median(values)),
+                         "p05": float(np.percentile(values, 5)), "p95": float(np.percentile(values, 95))}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the model on the held-out test split.")
+    parser.add_argument("--weights", type=str, default="model/finetuned/colorizer.safetensors")
+    parser.add_argument("--split", type=str, default="test", choices=["train", "val", "test"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=0, help="Score at most this many images (0 = all).")
+    parser.add_argument("--pipeline", action="store_true", help="Score the served pipeline instead of the raw model.")
+    parser.add_argument("--mode", type=str, default="grid", choices=["grid", "native"])
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--vibrancy", type=float, default=2.0)
+    parser.add_argument("--output", type=str, default="results/eval")
+    args = parser.parse_args()
+
+    dataset = ColorizationDataset(split=args.split)
+    if len(dataset) == 0:
+        sys.exit("Nothing to evaluate.")
+    if args.limit:
+        dataset = torch.utils.data.Subset(dataset, range(min(args.limit, len(dataset))))
+    base = dataset.dataset if isinstance(dataset, torch.utils.data.Subset) else dataset
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.workers,
+                        pin_memory=(DEVICE == "cuda"))
+
+    if args.pipeline:
+        predict = pipeline_predictor(args.weights, args.mode, args.adaptive, args.vibrancy)
+    else:
+        predict = model_predictor(args.weights)
+
+    columns = {name: [] for name in METRICS}
+    start = time.perf_counter()
+    with torch.no_grad():
+        for l, ab_true in tqdm(loader, desc=f"Evaluating {args.split}"):
+            l = l.to(DEVICE, non_blocking=True)
+            ab_true = ab_true.to(DEVICE, non_blocking=True)
+            for name, values in batch_metrics(l, predict(l), ab_true).items():
+                columns[name].extend(values.cpu().tolist())
+    seconds = time.perf_counter() - start
+
+    count = len(columns["psnr"])
+    files = [base.l_files[base.indices[i]] for i in range(count)]
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "per_image.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", *METRICS])
+        for i, name in enumerate(files):
+            writer.writerow([name, *(f"{columns[m][i]:.5f}" for m in METRICS)])
+
+    report = {
+        "split": args.split,
+        "images": count,
+        "source": "pipeline" if args.pipeline else "model",
+        "config": {"weights": args.weights, "mode": args.mode, "adaptive": args.adaptive,
+                   "vibrancy": args.vibrancy, "batch_size": args.batch_size, "device": DEVICE},
+        "seconds": seconds,
+        "images_per_second": count / seconds if seconds > 0 else None,
+        "metrics": summarize(columns),
+    }
+    with open(os.path.join(args.output, "summary.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nScored {count} images in {seconds:.1f}s ({report['images_per_second']:.1f} img/s)")
+    for name, stats in report["metrics"].items():
+        print(f"  {name:<16}{stats['mean']:>9.4f} (median {stats['median']:.4f})")
+    print(f"Reports written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
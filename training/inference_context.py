@@ -0,0 +1,83 @@
+"""
+Reusable buffers for the fixed-size (256x256) forwards of the tiled pipeline.
+
+Every global/tile pass used to allocate a resized patch, a float32 L array, a tensor and,
+on GPU, a host copy of the output. An InferenceContext allocates those once for its
+largest batch and reuses them:
+
+    uint8 staging (B, 256, 256)   cv2.resize(..., dst=) writes each patch here
+    float32 input (B, 1, 256, 256) normalized in place with np.multiply(..., out=);
+                                   pinned on CUDA so the upload can run asynchronously
+    float32 output (B, 2, 256, 256) host copy of the model output (pinned on CUDA)
+
+Results are views into the context's buffers, valid until its next forward. What is
+saved is the pre- and post-processing around the model; the model's own activations
+and output tensor are still allocated by torch on every forward. Contexts are not
+thread-safe; thread_context() keeps one per thread.
+"""
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+MODEL_SIZE = 256
+
+_local = threading.local()
+
+
+class InferenceContext:
+    def __init__(self, device, max_batch, size=MODEL_SIZE, pin=None):
+        self.device = torch.device(device)
+        self.max_batch = max_batch
+        self.size = size
+        cuda = self.device.type == "cuda"
+        pin = cuda if pin is None else pin
+
+        self.staging = np.empty((max_batch, size, size), dtype=np.uint8)
+        self.host_in = torch.empty((max_batch, 1, size, size), dtype=torch.float32, pin_memory=pin)
+        self.l = self.host_in.numpy()[:, 0] # (B, H, W) view of the input tensor
+        self.device_in = self.host_in
+        if cuda:
+            self.device_in = torch.empty((max_batch, 1, size, size), dtype=torch.float32, device=self.device)
+        self.host_out = torch.empty((max_batch, 2, size, size), dtype=torch.float32, pin_memory=pin)
+        self.ab = self.host_out.numpy()
+
+    def load(self, patches):
+        """
+        Resizes each patch (uint8 L plane, or BGR image) into the input buffer and
+        normalizes it to [0, 1]. Returns the batch size.
+        """
+        n = len(patches)
+        if n > self.max_batch:
+            raise ValueError(f"batch of {n} exceeds this context's {self.max_batch}")
+        dsize = (self.size, self.size)
+        for i, patch in enumerate(patches):
+            if patch.ndim == 2:
+                cv2.resize(patch, dsize, dst=self.staging[i])
+            else:
+                self.staging[i] = cv2.cvtColor(cv2.resize(patch, dsize), cv2.COLOR_BGR2LAB)[:, :, 0]
+        np.multiply(self.staging[:n], np.float32(1.0 / 255.0), out=self.l[:n], casting="unsafe")
+        return n
+
+    def forward(self, model, n):
+        """Runs `model` on the first `n` loaded inputs -> AB (n, 2, H, W) float32, a reused buffer."""
+        x = self.device_in[:n]
+        if self.device_in is not self.host_in:
+            x.copy_(self.host_in[:n], non_blocking=True)
+        with torch.no_grad():
+            ab = model(x)
+        self.host_out[:n].copy_(ab)
+        return self.ab[:n]
+
+
+def thread_context(device, max_batch, size=MODEL_SIZE):
+    """This thread's InferenceContext for (device, max_batch, size), created on first use."""
+    contexts = getattr(_local, "contexts", None)
+    if contexts is None:
+        contexts = _local.contexts = {}
+    key = (str(device), max_batch, size)
+    context = contexts.get(key)
+    if context is None:
+        context = contexts[key] = InferenceContext(device, max_batch, size)
+    return context
@@ -0,0 +1,84 @@
+"""
+Native-resolution inference, shared by the CLI (inference/colorize.py) and the server.
+
+The model is fully convolutional (stride 32), so instead of squashing to 256x256 the L
+plane is resized to a working size (long side, never upscaled), padded to a multiple of
+32 and run through the model directly. Working planes larger than `max_side` are split
+into a few large overlapping tiles, blended back with linear edge ramps.
+
+Tiles are batched by pixel count rather than by tile count: a forward never holds more
+than `batch_pixels` input pixels (but always at least one tile), which is what bounds
+its activation memory.
+"""
+import cv2
+import numpy as np
+
+MAX_SIDE = 1536             # Larger working planes are split into overlapping tiles of this size
+TILE_OVERLAP = 128
+BATCH_PIXELS = 4_000_000    # Input pixels per forward: one full 1536px tile, or several smaller ones
+MAX_WORKING_SIZE = 4096     # Requests asking for more are clipped to this long side
+
+
+def clip_working_size(working_size, default):
+    """Request value -> usable working size (long side), within [64, MAX_WORKING_SIZE]."""
+    return int(np.clip(working_size or default, 64, MAX_WORKING_SIZE))
+
+
+def edge_ramp(length, overlap, ramp_start, ramp_end):
+    """1D blend weight: rises over `overlap` px on the sides that border another tile."""
+    w = np.ones(length, dtype=np.float32)
+    ramp = np.linspace(1.0 / (overlap + 1), 1.0, overlap, dtype=np.float32)
+    if ramp_start: w[:overlap] = ramp
+    if ramp_end: w[-overlap:] = ramp[::-1]
+    return w
+
+
+def predict_native_ab(forward, orig_l, working_size, max_side=MAX_SIDE, overlap=TILE_OVERLAP,
+                      batch_pixels=BATCH_PIXELS):
+    """
+    `forward(l_batch)` maps normalized L planes (B, H, W) float32 to AB (B, 2, H, W).
+    Returns (a, b, info) with a, b at the original resolution and info holding the
+    working size, tile count and number of forward calls.
+    """
+    orig_h, orig_w = orig_l.shape[:2]
+    scale = min(1.0, working_size / max(orig_h, orig_w))
+    work_w, work_h = max(32, round(orig_w * scale)), max(32, round(orig_h * scale))
+    l_work = cv2.resize(orig_l, (work_w, work_h), interpolation=cv2.INTER_AREA)
+
+    tile = max_side - max_side % 32 if max(work_h, work_w) > max_side else None
+    pad_h = -(-work_h // 32) * 32 - work_h
+    pad_w = -(-work_w // 32) * 32 - work_w
+    l_pad = cv2.copyMakeBorder(l_work, 0, pad_h, 0, pad_w, cv2.BORDER_REFLECT_101)
+    l_pad = l_pad.astype(np.float32) / 255.0
+    pad_total_h, pad_total_w = l_pad.shape
+
+    if tile is None:
+        ab = forward(l_pad[None])[0]
+        tiles, forwards = 1, 1
+    else:
+        # Tiles only split the dimension(s) that exceed the limit
+        tile_h, tile_w = min(tile, pad_total_h), min(tile, pad_total_w)
+        n_y = int(np.ceil(max(pad_total_h - overlap, 1) / max(tile_h - overlap, 1)))
+        n_x = int(np.ceil(max(pad_total_w - overlap, 1) / max(tile_w - overlap, 1)))
+        ys = np.linspace(0, pad_total_h - tile_h, n_y).astype(int)
+        xs = np.linspace(0, pad_total_w - tile_w, n_x).astype(int)
+        boxes = [(y, x) for y in ys for x in xs]
+        per_forward = max(1, batch_pixels // (tile_h * tile_w))
+
+        ab = np.zeros((2, pad_total_h, pad_total_w), dtype=np.float32)
+        weight_sum = np.zeros((pad_total_h, pad_total_w), dtype=np.float32)
+        for start in range(0, len(boxes), per_forward):
+            chunk = boxes[start:start + per_forward]
+            ab_tiles = forward(np.stack([l_pad[y:y + tile_h, x:x + tile_w] for y, x in chunk]))
+            for (y, x), ab_tile in zip(chunk, ab_tiles):
+                weight = np.outer(edge_ramp(tile_h, overlap, y > 0, y + tile_h < pad_total_h),
+                                  edge_ramp(tile_w, overlap, x > 0, x + tile_w < pad_total_w))
+                ab[:, y:y + tile_h, x:x + tile_w] += ab_tile * weight
+                weight_sum[y:y + tile_h, x:x + tile_w] += weight
+        ab /= np.maximum(weight_sum, 1e-6)
+        tiles, forwards = len(boxes), -(-len(boxes) // per_forward)
+
+    a = cv2.resize(ab[0, :work_h, :work_w], (orig_w, orig_h), interpolation=cv2.INTER_CUBIC)
+    b = cv2.resize(ab[1, :work_h, :work_w], (orig_w, orig_h), interpolation=cv2.INTER_CUBIC)
+    info = {"working_size": [work_w, work_h], "tiles": tiles, "forwards": forwards}
+    return a, b, info
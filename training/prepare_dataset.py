@@ -1,53 +1,121 @@
 import os
 import cv2
+import json
+import time
+import shutil
+import contextlib
 import numpy as np
 import argparse
 from tqdm import tqdm
 
+from dedup import DedupIndex, DEFAULT_THRESHOLD, decode, phash, read_for_hash
+from raw_sources import RawStream, DEFAULT_READ_AHEAD
+
 # Define paths relative to the project root
 # Assuming script is run from project root: python training/prepare_dataset.py
 RAW_DATA_PATH = r'data/raw'
 PROCESSED_PATH = r'data/processed/train'
 L_PATH = os.path.join(PROCESSED_PATH, 'L')
 AB_PATH = os.path.join(PROCESSED_PATH, 'AB')
+INDEX_PATH = os.path.join(PROCESSED_PATH, 'dedup_index.json')
+REPORT_PATH = os.path.join(PROCESSED_PATH, 'dedup_report.json')
+MANIFEST_PATH = os.path.join(PROCESSED_PATH, 'manifest.json')
+NPY_BYTES_PER_PIXEL = 4 + 8 # float32 L + float32 AB pair
+NPY_HEADER_BYTES = 2 * 128
+
+def output_paths(img_id):
+    filename = f"{img_id:06d}.npy"
+    return os.path.join(L_PATH, filename), os.path.join(AB_PATH, filename)
 
-def prepare_dataset():
+def prepare_dataset(threshold=DEFAULT_THRESHOLD, rebuild_index=False, read_ahead=DEFAULT_READ_AHEAD):
     """
     Reads RGB images from data/raw, converts them to LAB color space,
     and saves the L channel (input) and AB channels (target) as .npy files.
+    Images inside tar/zip archives are streamed and decoded from memory, never extracted;
+    up to `read_ahead` images are read ahead of the conversion on a background thread.
+    Near-duplicates (pHash within `threshold` bits of a kept image, -1 to disable) are
+    skipped. Files already in the dedup index are not read again, so re-running after
+    adding images only converts the new ones. manifest.json maps each output id to its
+    source file, or archive and member.
     """
     
     # 1. Create directory structure
     print("Setting up directory structure...")
+    if rebuild_index:
+        # The fresh index hands out ids from 0 again; outputs of the old numbering would
+        # otherwise linger past the new count or be overwritten by unrelated images
+        for path in (L_PATH, AB_PATH):
+            shutil.rmtree(path, ignore_errors=True)
+        print("Rebuilding the index: cleared previous L/AB outputs.")
     os.makedirs(L_PATH, exist_ok=True)
     os.makedirs(AB_PATH, exist_ok=True)
     print(f"Output directories ready:\n - {L_PATH}\n - {AB_PATH}")
 
-    # 2. Gather all image files recursively
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
-    image_files = []
-
-    print(f"Scanning {RAW_DATA_PATH} for images...")
-    for root, _, files in os.walk(RAW_DATA_PATH):
-        for file in files:
-            if os.path.splitext(file)[1].lower() in image_extensions:
-                image_files.append(os.path.join(root, file))
-
-    if not image_files:
-        print(f"No images found in {RAW_DATA_PATH}. Please check your data.")
-        return
+    # 2. Load the dedup index; known, unchanged files are skipped without being read
+    index = DedupIndex(INDEX_PATH, threshold)
+    if not rebuild_index:
+        index = DedupIndex.load(INDEX_PATH, threshold,
+                                output_exists=lambda i: all(os.path.exists(p) for p in output_paths(i)))
 
-    print(f"Found {len(image_files)} images. Starting conversion...")
+    # 3. Stream image files and archive members from data/raw. The reader thread only looks
+    # up sources it has not handed over yet, which the loop below never writes.
+    print(f"Scanning {RAW_DATA_PATH} for images and tar/zip archives...")
+    stream = RawStream(RAW_DATA_PATH, want=lambda image: not index.is_known(image.source, image.stat),
+                       read_ahead=read_ahead)
 
-    # 3. Process images
+    # 4. Process images
     success_count = 0
     error_count = 0
-    img_id = 0
-
-    for img_path in tqdm(image_files, desc="Converting Images"):
+    duplicates = []
+    hash_seconds = 0.0
+    convert_seconds = 0.0
+    written_bytes = 0
+    skipped_bytes = 0 # Outputs the duplicates would have written
+    rechecked = 0
+    ingest_start = time.perf_counter()
+
+    def sources():
+        nonlocal rechecked
+        yield from stream
+        # Duplicates of images that changed in this run lost their match. The ones the
+        # stream had already passed are read again in a second, targeted pass.
+        orphans = index.take_orphans()
+        if orphans:
+            rechecked = len(orphans)
+            yield from RawStream(RAW_DATA_PATH, want=lambda image: image.source in orphans, read_ahead=read_ahead)
+
+    for raw, data in tqdm(sources(), desc="Converting Images"):
+        img_path = raw.source
+        provenance = {"stat": raw.stat, "archive": raw.archive, "member": raw.member}
         try:
-            # Read image in color mode (BGR default in OpenCV)
-            img = cv2.imread(img_path)
+            if data is None:
+                error_count += 1
+                continue
+            # Hash a reduced grayscale decode first, so duplicates never get a full decode
+            start = time.perf_counter()
+            small, scale = read_for_hash(data)
+            if small is None:
+                error_count += 1
+                continue
+            value = phash(small)
+            match = index.match(value, exclude=img_path)
+            hash_seconds += time.perf_counter() - start
+
+            if match is not None:
+                previous_id = (index.files.get(img_path) or {}).get("id")
+                index.add(img_path, value, duplicate_of=match[0], **provenance)
+                if previous_id is not None: # Was kept before it changed; drop its stale outputs
+                    for path in output_paths(previous_id):
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(path)
+                duplicates.append({"file": img_path, "duplicate_of": match[0], "distance": match[1]})
+                full_pixels = small.shape[0] * small.shape[1] * scale * scale
+                skipped_bytes += full_pixels * NPY_BYTES_PER_PIXEL + NPY_HEADER_BYTES
+                continue
+
+            start = time.perf_counter()
+            # Decode in color mode (BGR default in OpenCV), from the bytes already in memory
+            img = decode(data)
 
             if img is None:
                 # Could not decode image
@@ -80,30 +148,88 @@ def prepare_dataset():
             ab_channels = np.dstack((a_channel, b_channel))
 
             # Fix 3: Use a numeric counter for filenames to prevent collisions
-            filename = f"{img_id:06d}"
+            # (the index hands out ids, continuing after the previous run's last one)
+            l_file, ab_file = output_paths(index.add(img_path, value, **provenance))
             
             # Save as NumPy arrays for efficient loading in ML
             # L channel shape: (H, W)
             # AB channel shape: (H, W, 2)
-            np.save(os.path.join(L_PATH, f"{filename}.npy"), l_channel)
-            np.save(os.path.join(AB_PATH, f"{filename}.npy"), ab_channels)
+            np.save(l_file, l_channel)
+            np.save(ab_file, ab_channels)
+            convert_seconds += time.perf_counter() - start
+            written_bytes += os.path.getsize(l_file) + os.path.getsize(ab_file)
 
             success_count += 1
-            img_id += 1
+            if success_count % 500 == 0:
+                index.save() # An interrupted run keeps what it already converted
 
         except Exception as e:
             error_count += 1
             # print(f"Error processing {img_path}: {e}") # Uncomment for verbose error logging
 
-    # 4. Final Report
+    index.save()
+    ingest_seconds = time.perf_counter() - ingest_start
+    if stream.scanned == 0:
+        print(f"No images found in {RAW_DATA_PATH}. Please check your data.")
+        return
+    error_count += len(stream.failed_archives)
+    manifest = index.manifest()
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump({"images": manifest}, f)
+
+    # Savings: each duplicate would have cost one average conversion and its outputs
+    mean_convert = convert_seconds / success_count if success_count else 0.0
+    report = {
+        "scanned": stream.scanned,
+        "archives": stream.archives,
+        "failed_archives": [{"archive": path, "error": error} for path, error in stream.failed_archives],
+        "already_indexed": stream.skipped,
+        "converted": success_count,
+        "duplicates_skipped": len(duplicates),
+        "duplicates_rechecked": rechecked,
+        "errors": error_count,
+        "threshold_bits": threshold,
+        "hash_seconds": hash_seconds,
+        "convert_seconds": convert_seconds,
+        "read_seconds": stream.read_seconds,
+        "ingest_seconds": ingest_seconds,
+        "read_mb": stream.read_bytes / 1e6,
+        "estimated_seconds_saved": len(duplicates) * mean_convert - hash_seconds,
+        "written_mb": written_bytes / 1e6,
+        "estimated_mb_saved": skipped_bytes / 1e6,
+        "duplicates": duplicates,
+    }
+    with open(REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+
+    # 5. Final Report
     print("\n" + "="*30)
     print("      PROCESSING COMPLETE      ")
     print("="*30)
+    print(f"Images scanned         : {stream.scanned} ({stream.archives} archives)")
     print(f"Successfully processed : {success_count}")
+    print(f"Already indexed        : {report['already_indexed']}")
+    print(f"Near-duplicates skipped: {len(duplicates)}")
     print(f"Corrupted / Skipped    : {error_count}")
+    for path, error in stream.failed_archives:
+        print(f"  unreadable archive   : {path} ({error})")
+    print(f"Ingest time            : {ingest_seconds:.1f}s (read {report['read_mb']:.1f} MB in {stream.read_seconds:.1f}s, overlapped)")
+    print(f"Hashing time           : {hash_seconds:.1f}s (conversion {convert_seconds:.1f}s)")
+    print(f"Estimated time saved   : {report['estimated_seconds_saved']:.1f}s (net of hashing)")
+    print(f"Estimated disk saved   : {report['estimated_mb_saved']:.1f} MB (wrote {report['written_mb']:.1f} MB)")
+    print(f"Dedup report           : {REPORT_PATH}")
+    print(f"Manifest               : {MANIFEST_PATH} ({len(manifest)} images)")
     print(f"L channel saved to     : {L_PATH}")
     print(f"AB channels saved to   : {AB_PATH}")
     print("="*30)
 
 if __name__ == "__main__":
-    prepare_dataset()
+    parser = argparse.ArgumentParser(description="Convert data/raw images (loose or in tar/zip archives) into L/AB training arrays.")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="Max pHash Hamming distance (0-64) treated as a near-duplicate; -1 keeps everything.")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="Ignore the saved dedup index, clear the L/AB outputs and convert everything again.")
+    parser.add_argument("--read-ahead", type=int, default=DEFAULT_READ_AHEAD,
+                        help="Images read ahead of the conversion (bounds the memory held by the reader).")
+    args = parser.parse_args()
+    prepare_dataset(threshold=args.threshold, rebuild_index=args.rebuild_index, read_ahead=args.read_ahead)
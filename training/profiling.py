@@ -0,0 +1,124 @@
+"""
+Opt-in profiler for the training loop.
+
+StepProfiler covers the first N steps of train_one_epoch. It records wall time per
+phase (data wait, forward, backward, optimizer) and a torch.profiler trace with
+operator-level statistics:
+
+    <out_dir>/trace.json     Chrome trace (chrome://tracing or https://ui.perfetto.dev)
+    <out_dir>/operators.txt  top operators by self time
+    <out_dir>/phases.json    per-step phase timings and their means
+
+"data" is the loader wait plus the host-to-device copy.
+
+When profiling is off, train_one_epoch gets NO_PROFILER, whose hooks do nothing.
+"""
+import os
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+PHASES = ("data", "forward", "backward", "optimizer")
+_NULL = nullcontext()
+
+
+class NullProfiler:
+    """Stand-in used when profiling is disabled (or finished)."""
+
+    active = False
+
+    def phase(self, name):
+        return _NULL
+
+    def data_ready(self):
+        pass
+
+    def step_done(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+NO_PROFILER = NullProfiler()
+
+
+class StepProfiler(NullProfiler):
+    """Profiles `steps` training steps, then writes its reports and turns itself off."""
+
+    def __init__(self, steps, out_dir, device):
+        self.steps, self.out_dir, self.device = steps, out_dir, device
+        self.times = {name: [] for name in PHASES}
+        self.step = 0
+        self.active = False
+        self._current = {}
+        self._last = None
+        self._prof = None
+
+    def start(self):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.device == "cuda":
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._prof = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+        self._prof.__enter__()
+        self.active = True
+        self._last = time.perf_counter()
+        return self
+
+    def _sync(self):
+        # Phase boundaries are only meaningful once queued GPU work has finished
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+
+    def data_ready(self):
+        """Called when the loader hands over a batch: the gap since the last step is data wait."""
+        if self.active:
+            self._current = {"data": time.perf_counter() - self._last}
+
+    @contextmanager
+    def phase(self, name):
+        if not self.active:
+            yield
+            return
+        self._sync()
+        start = time.perf_counter()
+        with torch.profiler.record_function(name):
+            yield
+        self._sync()
+        self._current[name] = self._current.get(name, 0.0) + time.perf_counter() - start
+
+    def step_done(self):
+        if not self.active:
+            return
+        self._prof.step()
+        for name in PHASES:
+            self.times[name].append(self._current.get(name, 0.0))
+        self.step += 1
+        self._last = time.perf_counter()
+        if self.step >= self.steps:
+            self.finish()
+
+    def finish(self):
+        if not self.active:
+            return
+        self.active = False
+        self._prof.__exit__(None, None, None)
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        self._prof.export_chrome_trace(os.path.join(self.out_dir, "trace.json"))
+        sort_by = "self_cuda_time_total" if self.device == "cuda" else "self_cpu_time_total"
+        with open(os.path.join(self.out_dir, "operators.txt"), "w") as f:
+            f.write(self._prof.key_averages().table(sort_by=sort_by, row_limit=40))
+
+        means = {name: sum(v) / len(v) * 1000.0 for name, v in self.times.items() if v}
+        with open(os.path.join(self.out_dir, "phases.json"), "w") as f:
+            json.dump({"steps": self.step, "mean_ms": means,
+                       "per_step_ms": {k: [t * 1000.0 for t in v] for k, v in self.times.items()}}, f, indent=2)
+
+        total = sum(means.values()) or 1.0
+        print(f"\nProfiled {self.step} steps -> {self.out_dir}")
+        for name in PHASES:
+            if name in means:
+                print(f"  {name:<10}{means[name]:>9.1f} ms/step {means[name] / total:>6.1%}")
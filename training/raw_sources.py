@@ -0,0 +1,192 @@
+"""
+Raw image sources for prepare_dataset.py: loose files and members of tar/zip archives.
+
+Everything under data/raw is walked. .tar (also .tar.gz/.tgz, .tar.bz2, .tar.xz) and
+.zip files are read in place instead of being extracted first. Each image has a source
+key, which is what the dedup index and the manifest record: its path for a loose file,
+"<archive>::<member>" for an archive member.
+
+RawStream reads the encoded bytes on a background thread, at most `read_ahead` images
+ahead of the consumer, so reading and decompression overlap with decoding and
+conversion. A tar archive is read in one sequential pass (compressed ones too); members
+the consumer does not want are passed over without being buffered.
+"""
+import os
+import lzma
+import time
+import zlib
+import queue
+import tarfile
+import zipfile
+import threading
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ZIP_EXTENSIONS = ('.zip',)
+MEMBER_SEPARATOR = "::"
+DEFAULT_READ_AHEAD = 32
+
+_DONE = object()
+
+# Archive-level failures: the rest of that archive is given up
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, lzma.LZMAError, OSError, EOFError)
+# A single corrupt or unsupported zip member (CRC/deflate errors, unknown compression method)
+MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, lzma.LZMAError, NotImplementedError, EOFError)
+
+
+class _Stopped(Exception):
+    pass
+
+
+def is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+class RawImage:
+    """One source image: its key, where it came from, and the (size, mtime) the dedup index compares."""
+
+    __slots__ = ("source", "size", "mtime", "archive", "member")
+
+    def __init__(self, source, size, mtime, archive=None, member=None):
+        self.source = source
+        self.size = size
+        self.mtime = mtime
+        self.archive = archive
+        self.member = member
+
+    @property
+    def stat(self):
+        return self.size, self.mtime
+
+
+class RawStream:
+    """
+    Iterates (RawImage, encoded bytes) over every image under `root`. `want(image)` is
+    called on the reader thread before anything is read; images it rejects are only
+    counted. The bytes are None for a loose file or zip member that could not be read.
+    An archive that cannot be read is listed in `failed_archives`, keeping the members
+    read before the error.
+    """
+
+    def __init__(self, root, want=None, read_ahead=DEFAULT_READ_AHEAD):
+        if read_ahead < 1:
+            raise ValueError("read_ahead must be at least 1")
+        self.root = root
+        self.want = want
+        self.read_ahead = read_ahead
+        self.scanned = 0         # Images seen, loose or in archives
+        self.skipped = 0         # Rejected by `want`, never read
+        self.archives = 0
+        self.failed_archives = [] # (path, error)
+        self.read_bytes = 0
+        self.read_seconds = 0.0  # Reader thread time spent reading and decompressing
+        self._queue = queue.Queue(maxsize=read_ahead)
+        self._stopped = threading.Event()
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._produce, name="raw-reader", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._stopped.set() # Unblocks the reader if the consumer stops early
+            thread.join()
+
+    def _paths(self):
+        for root, dirs, files in os.walk(self.root):
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+    def _produce(self):
+        try:
+            for path in self._paths():
+                lower = path.lower()
+                if lower.endswith(TAR_EXTENSIONS):
+                    self._read_archive(path, self._read_tar)
+                elif lower.endswith(ZIP_EXTENSIONS):
+                    self._read_archive(path, self._read_zip)
+                elif is_image(path):
+                    try:
+                        stat = os.stat(path)
+                    except OSError: # Removed or unreadable since the walk listed it
+                        self.scanned += 1
+                        self._put((RawImage(path, None, None), None))
+                        continue
+                    self._offer(RawImage(path, stat.st_size, stat.st_mtime), lambda: _read_file(path))
+            self._put(_DONE)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            try:
+                self._put(e)
+            except _Stopped:
+                pass
+
+    def _read_archive(self, path, read):
+        self.archives += 1
+        try:
+            read(path)
+        except ARCHIVE_ERRORS as e:
+            # Truncated or corrupt archive: keep what was read, report it, go on with the rest
+            self.failed_archives.append((path, f"{type(e).__name__}: {e}"))
+
+    def _read_tar(self, path):
+        # Stream mode: members come in archive order and only wanted ones are read
+        with tarfile.open(path, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile() or not is_image(member.name):
+                    continue
+                image = RawImage(f"{path}{MEMBER_SEPARATOR}{member.name}", member.size, float(member.mtime),
+                                 archive=path, member=member.name)
+                self._offer(image, lambda: tar.extractfile(member).read())
+
+    def _read_zip(self, path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image(info.filename):
+                    continue
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                image = RawImage(f"{path}{MEMBER_SEPARATOR}{info.filename}", info.file_size, mtime,
+                                 archive=path, member=info.filename)
+                # Members are independent in a zip: a damaged one is an error, the rest still count
+                self._offer(image, lambda: archive.read(info), errors=MEMBER_ERRORS)
+
+    def _offer(self, image, read, errors=()):
+        self.scanned += 1
+        if self.want is not None and not self.want(image):
+            self.skipped += 1
+            return
+        start = time.perf_counter()
+        try:
+            data = read()
+        except errors:
+            data = None
+        except OSError:
+            if image.archive is not None:
+                raise
+            data = None
+        self.read_seconds += time.perf_counter() - start
+        self.read_bytes += len(data) if data else 0
+        self._put((image, data))
+
+    def _put(self, item):
+        while True:
+            if self._stopped.is_set():
+                raise _Stopped()
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
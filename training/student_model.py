@@ -0,0 +1,49 @@
+import torch
+import torch.nn as nn
+import torchvision.models as models
+
+class StudentColorizationNet(nn.Module):
+    """
+    Lightweight ColorizationNet for previews, trained by distill.py against the full model.
+    Same interface: (Batch, 1, H, W) L in [0, 1] -> (Batch, 2, H, W) AB, stride 32.
+    """
+    def __init__(self, pretrained=True, decoder_channels=(128, 64, 32, 16, 8)):
+        super(StudentColorizationNet, self).__init__()
+
+        # 1. Encoder: MobileNetV3-Small features (ImageNet weights when pretrained)
+        # ~0.9M parameters instead of ResNet18's 11M; still downsamples by 32
+        # Output: (576, H/32, W/32)
+        weights = models.MobileNet_V3_Small_Weights.IMAGENET1K_V1 if pretrained else None
+        self.encoder = models.mobilenet_v3_small(weights=weights).features
+
+        # 2. Input Adapter (1 channel -> 3 channels), as in ColorizationNet
+        self.input_adapter = nn.Conv2d(1, 3, kernel_size=1)
+
+        # 3. Decoder: 5 x (conv, BN, ReLU, 2x upsample) with fewer channels, then AB head
+        layers = []
+        in_channels = 576
+        for out_channels in decoder_channels:
+            layers += [
+                nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1),
+                nn.BatchNorm2d(out_channels),
+                nn.ReLU(),
+                nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True),
+            ]
+            in_channels = out_channels
+        layers.append(nn.Conv2d(in_channels, 2, kernel_size=3, padding=1))
+        self.decoder = nn.Sequential(*layers)
+
+    def forward(self, x):
+        x = self.input_adapter(x)  # -> (Batch, 3, H, W)
+        x = self.encoder(x)        # -> (Batch, 576, H/32, W/32)
+        x = self.decoder(x)        # -> (Batch, 2, H, W)
+        return x
+
+if __name__ == "__main__":
+    model = StudentColorizationNet(pretrained=False)
+    dummy_input = torch.randn(1, 1, 256, 256)
+    output = model(dummy_input)
+    print(f"Parameters: {sum(p.numel() for p in model.parameters()) / 1e6:.2f}M")
+    print(f"Output shape: {output.shape}")
+    assert output.shape == (1, 2, 256, 256), "Output shape mismatch!"
+    print("Student architecture verification passed!")
@@ -1,4 +1,6 @@
 import os
+import time
+import argparse
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -6,8 +8,11 @@ from torch.utils.data import DataLoader
 from tqdm import tqdm
 
 # Import our custom modules
-from dataset import ColorizationDataset
+from dataset import ColorizationDataset, ResumableRandomSampler
 from colorization_model import ColorizationNet
+from profiling import StepProfiler, NO_PROFILER
+from checkpoint import load_weights, load_optimizer_state, read_sidecar, resolve_weights
+from checkpoint_writer import CheckpointWriter, latest_step_checkpoint, resume_position
 
 # --- Configuration ---
 BATCH_SIZE = 16          # Number of images per batch (reduce to 8 if you run out of memory)
@@ -16,43 +21,56 @@ NUM_EPOCHS = 20          # How many times to go through the dataset
 SAVE_DIR = "model/finetuned"
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-def train_one_epoch(model, loader, criterion, optimizer, scaler):
+def train_one_epoch(model, loader, criterion, optimizer, scaler, profiler=NO_PROFILER,
+                    start_step=0, running_loss=0.0, on_step=None):
     """
     Runs one epoch of training.
+    `profiler` (a StepProfiler) times the data/forward/backward/optimizer phases of its first steps.
+    A resumed epoch passes the batches already done (`start_step`) and their summed loss;
+    `on_step(step, running_loss)` is called after every step (used for checkpointing).
     """
     model.train()  # Set model to training mode
-    running_loss = 0.0
+    step = start_step
     
     # Progress bar for the loop
-    loop = tqdm(loader, desc="Training", leave=True)
+    loop = tqdm(loader, desc="Training", leave=True, initial=start_step, total=start_step + len(loader))
     
     for l_input, ab_target in loop:
+        profiler.data_ready()
+        
         # Move data to GPU if available
-        l_input = l_input.to(DEVICE)
-        ab_target = ab_target.to(DEVICE)
+        with profiler.phase("data"):
+            l_input = l_input.to(DEVICE)
+            ab_target = ab_target.to(DEVICE)
         
         # Zero the gradients
         optimizer.zero_grad()
         
         # Forward pass (predict colors)
         # We use mixed precision for speed/memory efficiency if available
-        with torch.cuda.amp.autocast(enabled=(DEVICE=="cuda")):
+        with profiler.phase("forward"), torch.cuda.amp.autocast(enabled=(DEVICE=="cuda")):
             ab_predicted = model(l_input)
             loss = criterion(ab_predicted, ab_target)
             
         # Backward pass (calculate gradients)
-        scaler.scale(loss).backward()
+        with profiler.phase("backward"):
+            scaler.scale(loss).backward()
         
         # Optimize (update weights)
-        scaler.step(optimizer)
-        scaler.update()
+        with profiler.phase("optimizer"):
+            scaler.step(optimizer)
+            scaler.update()
+        profiler.step_done()
         
         running_loss += loss.item()
+        step += 1
+        if on_step is not None:
+            on_step(step, running_loss)
         
         # Update progress bar
         loop.set_postfix(loss=loss.item())
         
-    avg_loss = running_loss / len(loader)
+    avg_loss = running_loss / max(step, 1)
     return avg_loss
 
 def validate(model, loader, criterion):
@@ -76,6 +94,16 @@ def validate(model, loader, criterion):
     return avg_loss
 
 def main():
+    parser = argparse.ArgumentParser(description="Train ColorizationNet.")
+    parser.add_argument("--profile-steps", type=int, default=0,
+                        help="Profile this many training steps (phase timings + Chrome trace), then continue normally.")
+    parser.add_argument("--profile-dir", type=str, default="results/profile")
+    parser.add_argument("--checkpoint-every", type=int, default=500,
+                        help="Also checkpoint every N training steps, so a crash loses at most N steps (0 = epoch ends only).")
+    parser.add_argument("--keep-checkpoints", type=int, default=3, help="Step checkpoints to keep.")
+    parser.add_argument("--seed", type=int, default=0, help="Shuffle seed (a resumed run keeps its checkpoint's seed).")
+    args = parser.parse_args()
+
     print(f"Using device: {DEVICE}")
     
     # 1. Setup Data Loaders
@@ -83,7 +111,10 @@ def main():
     train_dataset = ColorizationDataset(split="train")
     val_dataset = ColorizationDataset(split="val")
     
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=2, pin_memory=True)
+    # The shuffle order is a function of (seed, epoch), so a checkpoint can resume mid-epoch
+    sampler = ResumableRandomSampler(train_dataset, seed=args.seed)
+    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, sampler=sampler, num_workers=2, pin_memory=True)
+    steps_per_epoch = -(-len(train_dataset) // BATCH_SIZE)
     val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=2, pin_memory=True)
     
     # 2. Setup Model
@@ -101,23 +132,50 @@ def main():
     
     # 4. Check for Checkpoints to Resume
     os.makedirs(SAVE_DIR, exist_ok=True)
-    checkpoint_path = os.path.join(SAVE_DIR, "last_checkpoint.pth")
-    best_model_path = os.path.join(SAVE_DIR, "colorizer.pth")
+    # Weights: <name>.safetensors, optimizer: <name>.optim.pt, metadata: <name>.json
+    # Step checkpoints: checkpoints/step_<global step>.*, the newest --keep-checkpoints kept
+    checkpoint_path = os.path.join(SAVE_DIR, "last_checkpoint.safetensors")
+    best_model_path = os.path.join(SAVE_DIR, "colorizer.safetensors")
+    writer = CheckpointWriter(os.path.join(SAVE_DIR, "checkpoints"), keep=args.keep_checkpoints)
+    config = {"batch_size": BATCH_SIZE, "learning_rate": LEARNING_RATE, "num_epochs": NUM_EPOCHS,
+              "loss": "L1", "optimizer": "Adam", "frozen_encoder": True}
     
     start_epoch = 0
+    start_step = 0
+    resumed_loss = 0.0
     best_val_loss = float("inf")
     
-    if os.path.exists(checkpoint_path):
-        print(f"Found checkpoint at {checkpoint_path}. Resuming...")
-        checkpoint = torch.load(checkpoint_path, map_location=DEVICE)
+    # Resume from whichever is further along: the last epoch end or the newest step checkpoint
+    resume_path, sidecar = checkpoint_path, read_sidecar(checkpoint_path)
+    step_path, step_sidecar = latest_step_checkpoint(writer.step_dir)
+    if step_sidecar is not None and (sidecar is None or resume_position(step_sidecar) > resume_position(sidecar)):
+        resume_path, sidecar = step_path, step_sidecar
+    legacy_checkpoint = os.path.join(SAVE_DIR, "last_checkpoint.pth")
+    if sidecar is not None:
+        print(f"Found checkpoint at {resume_path}. Resuming...")
+        state, _, _ = load_weights(resume_path, device=DEVICE)
+        model.load_state_dict(state)
+        optim_state = load_optimizer_state(resume_path, device=DEVICE)
+        if optim_state is not None:
+            optimizer.load_state_dict(optim_state['optimizer'])
+            scaler.load_state_dict(optim_state['scaler'])
+        start_epoch, start_step = resume_position(sidecar)
+        resumed_loss = sidecar.get('running_loss', 0.0) if start_step else 0.0
+        best_val_loss = sidecar['best_val_loss']
+        sampler.seed = sidecar.get('seed', sampler.seed)
+        print(f"Resuming from Epoch {start_epoch+1}" + (f", step {start_step}/{steps_per_epoch}" if start_step else ""))
+    elif os.path.exists(legacy_checkpoint):
+        print(f"Found legacy checkpoint at {legacy_checkpoint}. Resuming...")
+        checkpoint = torch.load(legacy_checkpoint, map_location=DEVICE)
         model.load_state_dict(checkpoint['model_state_dict'])
         optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         start_epoch = checkpoint['epoch'] + 1
         best_val_loss = checkpoint['best_val_loss']
         print(f"Resuming from Epoch {start_epoch+1}")
-    elif os.path.exists(best_model_path):
-        print(f"Found existing weights at {best_model_path}. Loading weights but restarting Epoch counter...")
-        model.load_state_dict(torch.load(best_model_path, map_location=DEVICE))
+    elif resolve_weights(best_model_path):
+        print(f"Found existing weights at {resolve_weights(best_model_path)}. Loading weights but restarting Epoch counter...")
+        state, _, _ = load_weights(best_model_path, device=DEVICE)
+        model.load_state_dict(state)
         print("Model knowledge restored. Training will show Epoch 1/20 but is building on previous work.")
     
     # 5. Training Loop
@@ -125,30 +183,51 @@ def main():
     print("      STARTING TRAINING      ")
     print("="*30)
     
-    for epoch in range(start_epoch, NUM_EPOCHS):
-        print(f"\nEpoch {epoch+1}/{NUM_EPOCHS}")
+    profiler = StepProfiler(args.profile_steps, args.profile_dir, DEVICE).start() if args.profile_steps > 0 else NO_PROFILER
+    training_start = time.perf_counter()
+    
+    def training_state():
+        return {'optimizer': optimizer.state_dict(), 'scaler': scaler.state_dict()}
+    
+    try:
+        for epoch in range(start_epoch, NUM_EPOCHS):
+            print(f"\nEpoch {epoch+1}/{NUM_EPOCHS}")
+            first_step = start_step if epoch == start_epoch else 0
+            sampler.set_epoch(epoch, start=first_step * BATCH_SIZE)
+        
+            def on_step(step, running_loss):
+                # The epoch-end checkpoint below covers the last step
+                if args.checkpoint_every > 0 and step % args.checkpoint_every == 0 and step < steps_per_epoch:
+                    writer.save_step(epoch * steps_per_epoch + step, model, training_state(),
+                                     epoch=epoch, step=step, running_loss=running_loss,
+                                     best_val_loss=best_val_loss, seed=sampler.seed, config=config)
         
-        # Train
-        train_loss = train_one_epoch(model, train_loader, criterion, optimizer, scaler)
+            # Train
+            train_loss = train_one_epoch(model, train_loader, criterion, optimizer, scaler, profiler,
+                                         start_step=first_step, running_loss=resumed_loss if first_step else 0.0,
+                                         on_step=on_step)
+            profiler.finish() # No-op unless the epoch had fewer steps than requested
         
-        # Validate
-        val_loss = validate(model, val_loader, criterion)
+            # Validate
+            val_loss = validate(model, val_loader, criterion)
         
-        print(f"Result: Train Loss: {train_loss:.5f} | Val Loss: {val_loss:.5f}")
+            print(f"Result: Train Loss: {train_loss:.5f} | Val Loss: {val_loss:.5f}")
         
-        # Save "last" checkpoint (for resuming)
-        torch.save({
-            'epoch': epoch,
-            'model_state_dict': model.state_dict(),
-            'optimizer_state_dict': optimizer.state_dict(),
-            'best_val_loss': best_val_loss,
-        }, checkpoint_path)
+            # Save best model
+            if val_loss < best_val_loss:
+                best_val_loss = val_loss
+                writer.save(best_model_path, model, epoch=epoch, val_loss=val_loss,
+                            best_val_loss=best_val_loss, config=config)
+                print(f"--> New best model saved to {best_model_path} 🟢")
         
-        # Save best model
-        if val_loss < best_val_loss:
-            best_val_loss = val_loss
-            torch.save(model.state_dict(), best_model_path)
-            print(f"--> New best model saved to {best_model_path} 🟢")
+            # Save "last" checkpoint (for resuming)
+            writer.save(checkpoint_path, model, training_state(),
+                        epoch=epoch, train_loss=train_loss, val_loss=val_loss,
+                        best_val_loss=best_val_loss, seed=sampler.seed, config=config)
+            print(f"Checkpoint overhead: {writer.summary(time.perf_counter() - training_start)}")
+    finally:
+        # Also on a crash or Ctrl-C: a checkpoint already queued is written out, not lost half-way
+        writer.close()
             
     print("\n" + "="*30)
     print("      TRAINING COMPLETE      ")
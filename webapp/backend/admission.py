@@ -0,0 +1,190 @@
+"""
+Admission control for inference work.
+
+Every request is charged its estimated cost in megapixels, read from the image header
+before any pixels are decoded. Work is admitted while the in-flight total fits the
+budget, and waiting requests are granted strictly by priority (lower number first,
+then arrival order), so a brush stroke queued behind a large /colorize goes next.
+Lower-priority classes can be capped below the full budget; this keeps headroom
+for interactive requests while bulk jobs run.
+"""
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from webapp.backend import telemetry
+from webapp.backend.decoding import probe_image
+
+# Enough of the file to reach the JPEG frame header past typical EXIF/ICC segments
+HEADER_BYTES = 256 * 1024
+
+
+class AdmissionRejected(Exception):
+    """Request refused before inference; carries the HTTP status to answer with."""
+
+    def __init__(self, status, message, reason):
+        super().__init__(message)
+        self.status, self.message, self.reason = status, message, reason
+
+
+class BodyTooLarge(HTTPException):
+    """Raised from the request body stream once it passes the route's limit (see BodyLimitMiddleware)."""
+
+    def __init__(self, max_bytes):
+        super().__init__(413, f"Request body exceeds {max_bytes // (1024 * 1024)} MB.")
+
+
+class BodyLimitMiddleware:
+    """
+    Bounds every request body by `limit(scope)` bytes. A Content-Length over the limit is
+    refused before anything is read; a body without one (chunked) is counted as it streams
+    and cut off with BodyTooLarge, which the app turns into a 413.
+    """
+
+    def __init__(self, app, limit):
+        self.app, self.limit = app, limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        max_bytes = self.limit(scope)
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            error = BodyTooLarge(max_bytes)
+            telemetry.ADMISSION_REJECTED.inc(telemetry.current_endpoint.get(), "too_large")
+            return await JSONResponse(status_code=413, content={"error": error.detail})(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise BodyTooLarge(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def image_megapixels(contents):
+    """Megapixels from the JPEG/PNG header, or None if the header cannot be read."""
+    header = probe_image(contents)
+    if header is None or not header[0] or not header[1]:
+        return None
+    return header[0] * header[1] / 1e6
+
+
+async def read_capped(upload, max_bytes, head=b""):
+    """
+    Reads an UploadFile (the rest of it, after an already read `head`) in 1 MB chunks,
+    refusing it with a 413 as soon as it passes `max_bytes`.
+    """
+    chunks, size = [head], len(head)
+    while True:
+        chunk = await upload.read(1 << 20)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise AdmissionRejected(413, f"{upload.filename or 'Upload'} exceeds {max_bytes // (1024 * 1024)} MB.",
+                                    "too_large")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def read_upload(upload, max_bytes, max_megapixels):
+    """
+    Reads an UploadFile, refusing it as soon as the header shows too many pixels or the
+    body passes `max_bytes`, instead of buffering the whole thing first.
+    Returns: (contents, megapixels)
+    """
+    head = await upload.read(HEADER_BYTES)
+    megapixels = image_megapixels(head)
+    if megapixels is not None and megapixels > max_megapixels:
+        raise AdmissionRejected(413, f"Image is {megapixels:.1f} MP; the limit is {max_megapixels:g} MP.",
+                                "too_large")
+
+    contents = await read_capped(upload, max_bytes, head)
+
+    if megapixels is None:
+        megapixels = image_megapixels(contents)
+        if megapixels is None:
+            raise AdmissionRejected(400, "Could not read the image header (JPG/PNG expected).", "bad_header")
+        if megapixels > max_megapixels:
+            raise AdmissionRejected(413, f"Image is {megapixels:.1f} MP; the limit is {max_megapixels:g} MP.",
+                                    "too_large")
+    return contents, megapixels
+
+
+class AdmissionController:
+    """In-flight megapixel budget with a priority wait queue. Thread-safe; callers block in acquire()."""
+
+    def __init__(self, budget_mp, max_waiting, caps=None):
+        self.budget = budget_mp
+        self.max_waiting = max_waiting
+        self.caps = caps or {}  # priority -> highest in-flight total it may be admitted into
+        self.in_flight = 0.0
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, cost, priority, timeout=None):
+        """
+        Blocks until `cost` MP fits. A request larger than the whole budget runs alone.
+        With a timeout the wait queue is bounded and a full queue or an expired wait raise
+        AdmissionRejected (429); without one (background work) the caller simply waits.
+        Returns the cost actually charged, to pass back to release().
+        """
+        limit = min(self.caps.get(priority, self.budget), self.budget)
+        cost = min(cost, limit)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if timeout is not None and len(self._waiting) >= self.max_waiting:
+                raise AdmissionRejected(429, "Server is busy; retry shortly.", "queue_full")
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while self._waiting[0] != ticket or self.in_flight + cost > limit:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise AdmissionRejected(429, "Server is busy; retry shortly.", "timeout")
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            self.in_flight += cost
+            telemetry.ADMITTED_MEGAPIXELS.set(value=self.in_flight)
+            # The next waiter may fit alongside this one
+            self._cond.notify_all()
+        return cost
+
+    def release(self, cost):
+        with self._cond:
+            self.in_flight = max(0.0, self.in_flight - cost)
+            telemetry.ADMITTED_MEGAPIXELS.set(value=self.in_flight)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, cost, priority, timeout=None):
+        """Holds `cost` MP of the budget for the enclosed work; records the queue wait."""
+        start = time.perf_counter()
+        charged = self.acquire(cost, priority, timeout)
+        telemetry.ADMISSION_WAIT.observe(telemetry.current_endpoint.get(), value=time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.release(charged)
+
+    def status(self):
+        with self._cond:
+            return {"budget_mp": self.budget, "in_flight_mp": round(self.in_flight, 3), "waiting": len(self._waiting)}
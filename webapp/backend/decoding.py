@@ -0,0 +1,98 @@
+import struct
+
+import cv2
+import numpy as np
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic); they carry size + components
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# OpenCV's 8-bit LAB lightness for a neutral pixel depends only on its gray value,
+# so for black-and-white input L is a 256-entry table lookup instead of a LAB conversion.
+_GRAY_RAMP = np.arange(256, dtype=np.uint8).reshape(1, 256, 1).repeat(3, axis=2)
+GRAY_TO_L = cv2.cvtColor(_GRAY_RAMP, cv2.COLOR_BGR2LAB)[0, :, 0].copy()
+
+
+def probe_image(contents):
+    """
+    Reads (width, height, channels) from a JPEG or PNG header without decoding pixels.
+    Returns None for other formats or truncated headers.
+    """
+    if contents[:8] == _PNG_SIGNATURE and len(contents) >= 26 and contents[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", contents[16:24])
+        color_type = contents[25]
+        # 0 = gray, 4 = gray + alpha; everything else decodes to color
+        return width, height, 1 if color_type in (0, 4) else 3
+
+    if contents[:2] == b"\xff\xd8":
+        pos = 2
+        while pos + 4 <= len(contents):
+            if contents[pos] != 0xFF:
+                return None
+            marker = contents[pos + 1]
+            if marker == 0xFF: # Fill byte
+                pos += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7: # Stand-alone markers
+                pos += 2
+                continue
+            length = struct.unpack(">H", contents[pos + 2:pos + 4])[0]
+            if marker in _JPEG_SOF:
+                if pos + 10 > len(contents):
+                    return None
+                height, width = struct.unpack(">HH", contents[pos + 5:pos + 9])
+                return width, height, contents[pos + 9]
+            pos += 2 + length
+    return None
+
+
+def is_neutral(img_bgr, tolerance=2, band_rows=256):
+    """
+    True if every pixel has B, G and R within `tolerance` of each other (a B&W scan saved
+    as color). Checked band by band, so a color image usually stops at the first band.
+    """
+    for top in range(0, img_bgr.shape[0], band_rows):
+        b, g, r = cv2.split(img_bgr[top:top + band_rows])
+        spread = max(cv2.norm(b, g, cv2.NORM_INF), cv2.norm(g, r, cv2.NORM_INF), cv2.norm(b, r, cv2.NORM_INF))
+        if spread > tolerance:
+            return False
+    return True
+
+
+def decode_l_plane(contents):
+    """
+    Decodes an upload straight to its LAB lightness plane (uint8, OpenCV scaling).
+    Single-channel files are decoded single-channel, and color files whose pixels are
+    neutral are collapsed to gray, so neither pays for a full-frame 3-channel LAB conversion.
+    Returns: (l_plane, is_gray) or (None, None) if the data cannot be decoded.
+    """
+    buf = np.frombuffer(contents, np.uint8)
+    header = probe_image(contents)
+
+    if header is not None and header[2] == 1:
+        gray = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None, None
+        return cv2.LUT(gray, GRAY_TO_L), True
+
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        return None, None
+    if is_neutral(img):
+        return cv2.LUT(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), GRAY_TO_L), True
+    return cv2.cvtColor(img, cv2.COLOR_BGR2LAB)[:, :, 0], False
+
+
+def to_l_plane(img):
+    """Accepts either an L plane (H, W) or a BGR image (H, W, 3) and returns the L plane."""
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2LAB)[:, :, 0]
+
+
+def reduce_plane(l_plane, factor):
+    """Integer downscale of an L plane for model input; the full plane is kept for the final merge."""
+    if factor <= 1:
+        return l_plane
+    h, w = l_plane.shape[:2]
+    return cv2.resize(l_plane, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,402 @@
+"""
+Bulk colorization jobs.
+
+A job is a set of images submitted in one request (a zip or several files). Inputs are
+written under the job directory, and job/item state lives in SQLite next to them, so
+queued and half-finished jobs survive a restart. JobRunner threads claim items with a
+lease and process them in the background. The lease is renewed while the worker holds
+the item, so only an item whose worker died expires and is claimed again; a result is
+recorded only by the claim that still owns the item. Several processes may share one
+job directory.
+
+Run a standalone bulk worker (no HTTP server) against the same directory:
+    COLORIZE_JOB_WORKERS=0 python -m webapp.backend.serve ...   # API only
+    python -m webapp.backend.jobs --workers 2                    # bulk only
+"""
+import os
+import io
+import json
+import time
+import uuid
+import zlib
+import shutil
+import sqlite3
+import zipfile
+import logging
+import argparse
+import threading
+
+from webapp.backend import telemetry
+
+logger = logging.getLogger("colorize")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+TERMINAL_STATES = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    finished REAL,
+    total INTEGER NOT NULL,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    output_name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_until REAL,
+    lease_owner TEXT,
+    seconds REAL,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (status, job_id, idx);
+"""
+
+
+class JobError(ValueError):
+    """Invalid job submission (no images, too many images, unreadable archive)."""
+
+
+def archive_members(data, max_items, max_member_bytes, max_total_bytes):
+    """
+    Yields (name, bytes) for every JPG/PNG in a zip archive, skipping directories and macOS
+    metadata. The count and declared uncompressed sizes are checked before any member is
+    read, and members are read one at a time, so the caller can store each as it arrives.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise JobError(f"Not a readable zip archive: {e}")
+    with archive:
+        members, total = [], 0
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            if info.file_size > max_member_bytes:
+                raise JobError(f"{name} is larger than {max_member_bytes // (1024 * 1024)} MB uncompressed.")
+            total += info.file_size
+            if total > max_total_bytes:
+                raise JobError(f"Archive holds more than {max_total_bytes // (1024 * 1024)} MB of images uncompressed.")
+            members.append(info)
+            if len(members) > max_items:
+                raise JobError(f"Archive holds more than {max_items} images.")
+        for info in members:
+            try:
+                contents = archive.read(info)
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError) as e:
+                # CRC/deflate corruption only shows once the member is read
+                raise JobError(f"{info.filename}: unreadable ({e})")
+            if len(contents) > max_member_bytes: # The header may understate it
+                raise JobError(f"{info.filename} is larger than {max_member_bytes // (1024 * 1024)} MB uncompressed.")
+            yield info.filename, contents
+
+
+def output_name_for(name, taken):
+    """Result file name inside the download zip: the input's relative path with a .jpg extension."""
+    stem = os.path.splitext(name.replace("\\", "/").lstrip("/"))[0]
+    stem = "/".join(part for part in stem.split("/") if part not in ("", ".", ".."))
+    candidate, n = f"{stem or 'image'}.jpg", 1
+    while candidate in taken:
+        candidate, n = f"{stem or 'image'}_{n}.jpg", n + 1
+    taken.add(candidate)
+    return candidate
+
+
+class JobStore:
+    """SQLite-backed job state; inputs and results are plain files under `root/<job_id>/`."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, "jobs.sqlite3")
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(items)")}
+            if "lease_owner" not in columns: # Directories created before leases had owners
+                conn.execute("ALTER TABLE items ADD COLUMN lease_owner TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL") # Readers (status polls) never block the workers
+        return conn
+
+    def job_dir(self, job_id, *parts):
+        return os.path.join(self.root, job_id, *parts)
+
+    def input_path(self, job_id, idx):
+        return self.job_dir(job_id, "inputs", f"{idx:06d}")
+
+    def result_path(self, job_id, idx):
+        return self.job_dir(job_id, "results", f"{idx:06d}.jpg")
+
+    def create(self, images, settings):
+        """
+        Stores `images`, an iterable of (name, bytes), as a new pending job and returns the
+        job id. Each image is written out as it is produced; if the iterable raises, the
+        partial job directory is removed and nothing is queued.
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id, "inputs"))
+        os.makedirs(self.job_dir(job_id, "results"))
+        taken, rows = set(), []
+        try:
+            for idx, (name, data) in enumerate(images):
+                with open(self.input_path(job_id, idx), "wb") as f:
+                    f.write(data)
+                rows.append((job_id, idx, name, output_name_for(name, taken)))
+            if not rows:
+                raise JobError("No JPG/PNG images in the submission.")
+        except BaseException:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            raise
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO items (job_id, idx, name, output_name) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO jobs (id, created, total, settings) VALUES (?, ?, ?, ?)",
+                         (job_id, time.time(), len(rows), json.dumps(settings)))
+            conn.execute("COMMIT")
+        return job_id
+
+    def get(self, job_id):
+        """Job summary with per-state item counts, or None for an unknown id."""
+        with self._connect() as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+
+        done, failed = counts.get("done", 0), counts.get("failed", 0)
+        if done + failed == job["total"]:
+            status = "done" if done else "failed"
+        elif counts.get("running") or done or failed:
+            status = "running"
+        else:
+            status = "pending"
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": job["total"],
+            "done": done,
+            "failed": failed,
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "created": job["created"],
+            "finished": job["finished"],
+            "settings": json.loads(job["settings"]),
+        }
+
+    def items(self, job_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT idx, name, output_name, status, seconds, error FROM items "
+                                "WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, limit, lease_seconds):
+        """
+        Atomically takes up to `limit` runnable items, oldest job first: pending ones, and
+        running ones whose lease ran out. Returns (owner, [(job_id, idx, settings)]); `owner`
+        is this claim's lease token for renew() and finish().
+        """
+        now = time.time()
+        owner = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT items.job_id, items.idx, jobs.settings FROM items JOIN jobs ON jobs.id = items.job_id "
+                "WHERE items.status = 'pending' OR (items.status = 'running' AND items.lease_until < ?) "
+                "ORDER BY jobs.created, items.idx LIMIT ?", (now, limit)).fetchall()
+            conn.executemany("UPDATE items SET status = 'running', lease_until = ?, lease_owner = ? "
+                             "WHERE job_id = ? AND idx = ?",
+                             [(now + lease_seconds, owner, row["job_id"], row["idx"]) for row in rows])
+            conn.execute("COMMIT")
+        return owner, [(row["job_id"], row["idx"], json.loads(row["settings"])) for row in rows]
+
+    def renew(self, items, owner, lease_seconds):
+        """
+        Extends the lease on `items` [(job_id, idx)] still held by `owner`. Returns the set
+        of those it no longer holds (expired and claimed by someone else, or finished).
+        """
+        until = time.time() + lease_seconds
+        lost = set()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for job_id, idx in items:
+                cursor = conn.execute("UPDATE items SET lease_until = ? WHERE job_id = ? AND idx = ? "
+                                      "AND status = 'running' AND lease_owner = ?", (until, job_id, idx, owner))
+                if cursor.rowcount == 0:
+                    lost.add((job_id, idx))
+            conn.execute("COMMIT")
+        return lost
+
+    def finish(self, job_id, idx, seconds, error=None, owner=None):
+        """
+        Records an item's outcome. With `owner`, only if that claim still holds the item;
+        returns False when it does not (another worker took it over), True otherwise.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            query = ("UPDATE items SET status = ?, lease_until = NULL, lease_owner = NULL, seconds = ?, error = ? "
+                     "WHERE job_id = ? AND idx = ?")
+            params = ("failed" if error else "done", seconds, error, job_id, idx)
+            if owner is not None:
+                query += " AND status = 'running' AND lease_owner = ?"
+                params += (owner,)
+            updated = conn.execute(query, params).rowcount
+            conn.execute("UPDATE jobs SET finished = ? WHERE id = ? AND finished IS NULL AND NOT EXISTS "
+                         "(SELECT 1 FROM items WHERE job_id = ? AND status IN ('pending', 'running'))",
+                         (time.time(), job_id, job_id))
+            conn.execute("COMMIT")
+        return updated > 0
+
+    def results_zip(self, job_id):
+        """Builds (once) and returns the path of a zip holding every finished result."""
+        path = self.job_dir(job_id, "results.zip")
+        if os.path.exists(path):
+            return path
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        # JPEGs are already compressed; storing them keeps the zip step I/O-bound
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED) as archive:
+            for item in self.items(job_id):
+                if item["status"] == "done":
+                    archive.write(self.result_path(job_id, item["idx"]), item["output_name"])
+        os.replace(tmp, path)
+        return path
+
+
+class JobRunner:
+    """
+    Worker threads that drain the store. `process(contents, settings)` turns one input
+    file into encoded result bytes; it is supplied by the app so this module stays model-agnostic.
+    Nothing is claimed while `ready()` is False (e.g. the model is not loaded yet).
+    A heartbeat thread renews the leases of every claimed, unfinished item every
+    lease_seconds / 3, so slow admission under interactive load never lets them expire.
+    """
+
+    def __init__(self, store, process, workers=1, claim_size=4, lease_seconds=300.0, poll_seconds=1.0,
+                 ready=None):
+        self.store, self.process = store, process
+        self.workers, self.claim_size = workers, claim_size
+        self.lease_seconds, self.poll_seconds = lease_seconds, poll_seconds
+        self.ready = ready
+        self._stop = threading.Event()
+        self._threads = []
+        self._held = {} # owner -> {(job_id, idx)} claimed and not finished yet
+        self._lost = set() # (owner, job_id, idx) whose lease went to another claim
+        self._held_lock = threading.Lock()
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-lease-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._held_lock:
+                held = {owner: list(items) for owner, items in self._held.items() if items}
+            for owner, items in held.items():
+                try:
+                    lost = self.store.renew(items, owner, self.lease_seconds)
+                except sqlite3.Error:
+                    logger.exception("job lease renewal failed")
+                    continue
+                with self._held_lock:
+                    self._lost.update((owner, job_id, idx) for job_id, idx in lost)
+
+    def _loop(self):
+        telemetry.current_endpoint.set("/jobs")
+        while not self._stop.is_set():
+            if self.ready is not None and not self.ready():
+                self._stop.wait(self.poll_seconds)
+                continue
+            try:
+                owner, claimed = self.store.claim(self.claim_size, self.lease_seconds)
+            except sqlite3.Error:
+                logger.exception("job claim failed")
+                claimed = []
+            if not claimed:
+                self._stop.wait(self.poll_seconds)
+                continue
+            with self._held_lock:
+                self._held[owner] = {(job_id, idx) for job_id, idx, _ in claimed}
+            try:
+                for job_id, idx, settings in claimed:
+                    with self._held_lock:
+                        lost = (owner, job_id, idx) in self._lost
+                    if not lost:
+                        self.run_item(job_id, idx, settings, owner)
+                    with self._held_lock:
+                        self._held[owner].discard((job_id, idx))
+                        self._lost.discard((owner, job_id, idx))
+            finally:
+                with self._held_lock:
+                    self._held.pop(owner, None)
+
+    def run_item(self, job_id, idx, settings, owner=None):
+        start = time.perf_counter()
+        error = None
+        try:
+            with open(self.store.input_path(job_id, idx), "rb") as f:
+                result = self.process(f.read(), settings)
+            tmp = self.store.result_path(job_id, idx) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(result)
+            os.replace(tmp, self.store.result_path(job_id, idx))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning("job item failed job=%s idx=%d error=%s", job_id, idx, error)
+        seconds = time.perf_counter() - start
+        if not self.store.finish(job_id, idx, seconds, error, owner):
+            logger.warning("job item lease lost job=%s idx=%d; outcome left to its new worker", job_id, idx)
+            return
+        telemetry.JOB_ITEMS.inc("failed" if error else "done")
+        telemetry.STAGE_SECONDS.observe("/jobs", "item", value=seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standalone bulk-job worker (no HTTP server).")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for this process.")
+    args = parser.parse_args()
+
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    from webapp.backend import main as backend
+
+    backend.models.start(backend.WARMUP_BATCH_SIZES)
+    if not backend.models.ready:
+        raise SystemExit(f"Model not available: {backend.models.reason}")
+    runner = JobRunner(backend.open_job_store(), backend.process_job_item, workers=args.workers,
+                       claim_size=backend.JOB_CLAIM_SIZE, lease_seconds=backend.JOB_LEASE_SECONDS,
+                       ready=lambda: backend.models.ready)
+    runner.start()
+    logger.info("bulk worker started dir=%s workers=%d", backend.JOB_DIR, args.workers)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import torch
+
+from training.colorization_model import ColorizationNet
+from training.checkpoint import WEIGHTS_EXT, file_sha256, load_weights, resolve_weights, sidecar_path
+from webapp.backend import telemetry
+
+logger = logging.getLogger("colorize")
+
+
+class ServedModel:
+    """One loaded checkpoint. Requests lease it, so a swap never changes the model under them."""
+
+    def __init__(self, model, checkpoint_hash, meta, path, version):
+        self.model = model
+        self.checkpoint_hash = checkpoint_hash
+        self.meta = meta
+        self.path = path
+        self.version = version
+        self.in_flight = 0
+
+
+class ModelManager:
+    """
+    Owns a served model: loading, warm-up, hot-swap and the readiness state reported to the orchestrator.
+    States: "cold" -> "loading" -> "warming" -> "ready", or "error" with a reason.
+
+    reload() builds and warms a new checkpoint next to the serving one and swaps it in
+    atomically. Requests hold a lease() for their whole inference, so every batch of a
+    request uses one model; the old model is released once its last lease ends.
+    watch() polls the checkpoint files and reloads when they change.
+    """
+
+    def __init__(self, path, device, allow_untrained=False, factory=ColorizationNet, name="final"):
+        self.path = path
+        self.factory = factory
+        self.name = name
+        self.device = device
+        self.allow_untrained = allow_untrained
+        self.served = None
+        self.generation = 0
+        self.state = "cold"
+        self.reason = None
+        self.reloading = False
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.on_swap = [] # Callables (old ServedModel, new ServedModel), e.g. cache invalidation
+        self._lock = threading.Lock()       # Guards `served` and lease counts
+        self._drained = threading.Condition(self._lock)
+        self._reload_lock = threading.Lock() # One load/reload at a time
+        self._fingerprint = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def model(self):
+        served = self.served
+        return served.model if served is not None else None
+
+    @property
+    def checkpoint_hash(self):
+        served = self.served
+        return served.checkpoint_hash if served is not None else None
+
+    @property
+    def checkpoint_meta(self):
+        served = self.served
+        return served.meta if served is not None else None
+
+    @property
+    def version(self):
+        served = self.served
+        return served.version if served is not None else None
+
+    @contextmanager
+    def lease(self):
+        """The current ServedModel, pinned for the duration of the block."""
+        with self._lock:
+            served = self.served
+            if served is not None:
+                served.in_flight += 1
+        try:
+            yield served
+        finally:
+            if served is not None:
+                with self._lock:
+                    served.in_flight -= 1
+                    if served.in_flight == 0:
+                        self._drained.notify_all()
+
+    def _build(self, path):
+        """Loads `path` into a new, not yet served ServedModel. None if there are no weights."""
+        start = time.perf_counter()
+        model = self.factory(pretrained=False) # Every weight comes from the checkpoint
+        resolved = resolve_weights(path)
+        if resolved is not None:
+            logger.info("loading trained weights model=%s path=%s", self.name, resolved)
+            state, sidecar, resolved = load_weights(resolved, verify=True)
+            try:
+                # Adopt the mapped tensors instead of copying them into fresh parameters
+                model.load_state_dict(state, assign=True)
+            except TypeError: # torch < 2.1
+                model.load_state_dict(state)
+            verified = sidecar is not None and sidecar.get("sha256") and resolved.endswith(WEIGHTS_EXT)
+            checkpoint_hash = sidecar["sha256"] if verified else file_sha256(resolved)
+        elif self.allow_untrained:
+            logger.warning("weights not found model=%s path=%s, serving uninitialized weights", self.name, path)
+            sidecar, checkpoint_hash, resolved = None, "untrained", path
+        else:
+            return None
+
+        model.to(self.device)
+        model.eval()
+        self.load_seconds = time.perf_counter() - start
+        version = f"{self.name}:{checkpoint_hash[:12]}"
+        logger.info("model loaded model=%s sha256=%s seconds=%.2f", self.name, checkpoint_hash[:12], self.load_seconds)
+        return ServedModel(model, checkpoint_hash, sidecar, resolved, version)
+
+    def load(self):
+        """
+        Builds the model (`factory`) and loads its weights. Safe to call more than once.
+        .safetensors weights are memory-mapped and checked against their sidecar hash;
+        a legacy .pth state dict is still accepted.
+        """
+        with self._reload_lock:
+            if self.served is not None:
+                return self.served.model
+            self.state = "loading"
+            self._fingerprint = self.fingerprint()
+            served = self._build(self.path)
+            if served is None:
+                self.state = "error"
+                self.reason = f"checkpoint not found: {self.path}"
+                logger.error("weights not found model=%s path=%s; replica will stay unready", self.name, self.path)
+                return None
+            with self._lock:
+                self.served = served
+            telemetry.MODEL_INFO.set(str(self.device), value=1)
+            return served.model
+
+    def _warm(self, model, batch_sizes, size=256):
+        start = time.perf_counter()
+        with torch.no_grad():
+            for batch in batch_sizes:
+                dummy = torch.zeros((batch, 1, size, size), device=self.device)
+                model(dummy)
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info("warm-up done model=%s batch_sizes=%s seconds=%.2f", self.name, list(batch_sizes), self.warmup_seconds)
+
+    def warmup(self, batch_sizes, size=256):
+        """Runs throwaway forwards at the served batch sizes so allocator and kernel setup
+        happen before the first real request instead of during it."""
+        if self.model is None:
+            return
+        self.state = "warming"
+        self._warm(self.model, batch_sizes, size)
+
+    def start(self, batch_sizes):
+        """Full startup sequence; meant to run off the event loop so liveness answers meanwhile."""
+        try:
+            if self.load() is None:
+                return
+            self.warmup(batch_sizes)
+            self.state = "ready"
+        except Exception as e:
+            self.state = "error"
+            self.reason = f"{type(e).__name__}: {e}"
+            logger.exception("model startup failed model=%s", self.name)
+
+    def fingerprint(self, path=None):
+        """(weights file, mtime, size, sidecar mtime): changes whenever a checkpoint is (re)written."""
+        resolved = resolve_weights(path or self.path)
+        if resolved is None:
+            return None
+        try:
+            stat = os.stat(resolved)
+            sidecar_mtime = os.stat(sidecar_path(resolved)).st_mtime_ns if os.path.exists(sidecar_path(resolved)) else None
+        except FileNotFoundError: # Replaced between the checks; the next poll sees it settled
+            return None
+        return resolved, stat.st_mtime_ns, stat.st_size, sidecar_mtime
+
+    def reload(self, batch_sizes, path=None, drain_timeout=120.0):
+        """
+        Loads `path` (default: the configured checkpoint), warms it and swaps it in.
+        Serving continues on the current model meanwhile. Returns "swapped", "unchanged"
+        (same checkpoint hash) or "missing"; load errors propagate and leave the current model serving.
+        """
+        with self._reload_lock:
+            path = path or self.path
+            self.reloading = True
+            try:
+                fingerprint = self.fingerprint(path)
+                served = self._build(path)
+                if served is None:
+                    telemetry.MODEL_RELOADS.inc(self.name, "missing")
+                    return "missing"
+                if self.served is not None and served.checkpoint_hash == self.served.checkpoint_hash:
+                    self._fingerprint = fingerprint
+                    telemetry.MODEL_RELOADS.inc(self.name, "unchanged")
+                    return "unchanged"
+                self._warm(served.model, batch_sizes)
+            except Exception:
+                telemetry.MODEL_RELOADS.inc(self.name, "error")
+                raise
+            finally:
+                self.reloading = False
+
+            with self._lock:
+                old, self.served = self.served, served
+                self.path = path
+                self.generation += 1
+            self._fingerprint = fingerprint
+            self.state, self.reason = "ready", None
+        telemetry.MODEL_RELOADS.inc(self.name, "swapped")
+        telemetry.MODEL_INFO.set(str(self.device), value=1)
+        logger.info("model swapped model=%s version=%s previous=%s generation=%d",
+                    self.name, served.version, old.version if old else None, self.generation)
+
+        for callback in self.on_swap:
+            callback(old, served)
+        if old is not None:
+            threading.Thread(target=self._drain, args=(old, drain_timeout), daemon=True).start()
+        return "swapped"
+
+    def _drain(self, old, timeout):
+        """
+        Waits for the requests still leasing `old`. The manager no longer references it, so
+        it is freed once the last of them finishes (a straggler past the timeout keeps it alive).
+        """
+        start = time.perf_counter()
+        with self._lock:
+            drained = self._drained.wait_for(lambda: old.in_flight == 0, timeout)
+        logger.info("old model %s version=%s in_flight=%d seconds=%.2f", "drained" if drained else "drain timed out",
+                    old.version, old.in_flight, time.perf_counter() - start)
+        del old
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    def watch(self, interval, batch_sizes):
+        """Polls the checkpoint every `interval` seconds and reloads it when its files change."""
+        def poll():
+            while True:
+                time.sleep(interval)
+                fingerprint = self.fingerprint()
+                if fingerprint is None or fingerprint == self._fingerprint:
+                    continue
+                logger.info("checkpoint changed model=%s path=%s", self.name, fingerprint[0])
+                try:
+                    self.reload(batch_sizes)
+                except Exception:
+                    # Often a checkpoint caught mid-write; its next file change triggers another try
+                    self._fingerprint = fingerprint
+                    logger.exception("model reload failed model=%s", self.name)
+        threading.Thread(target=poll, name=f"model-watch-{self.name}", daemon=True).start()
+
+    def status(self):
+        served = self.served
+        return {
+            "model": self.name,
+            "status": self.state,
+            "reason": self.reason,
+            "device": str(self.device),
+            "version": served.version if served else None,
+            "generation": self.generation,
+            "reloading": self.reloading,
+            "checkpoint": served.path if served else self.path,
+            "checkpoint_sha256": served.checkpoint_hash if served else None,
+            "checkpoint_epoch": ((served.meta if served else None) or {}).get("epoch"),
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
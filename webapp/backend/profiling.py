@@ -0,0 +1,113 @@
+"""
+Per-request profiling for the inference endpoints.
+
+When PROFILING_ENABLED is set, a request sent with `X-Colorize-Profile: torch|cprofile`
+(or `?profile=torch|cprofile`) is profiled while its inference work runs. The result is
+stored under the profile directory, and the response carries `X-Profile-Id` and
+`X-Profile-Url` headers that point at the download. Requests without the flag only pay
+for one context-variable lookup.
+
+    torch    -> <id>.trace.json (Chrome trace, operator level) + <id>.txt (top operators)
+    cprofile -> <id>.prof (pstats dump, e.g. for snakeviz)   + <id>.txt (top functions)
+"""
+import os
+import io
+import re
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import torch
+
+MODES = ("torch", "cprofile")
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Set by the HTTP middleware for a profiled request: {"mode": ..., "id": None, "error": None}.
+# It is a mutable dict because the inference thread fills in the id for the middleware to read.
+current_request = contextvars.ContextVar("current_profile_request", default=None)
+
+# torch.profiler supports one active session per process
+_torch_lock = threading.Lock()
+
+
+def requested_mode(headers, query):
+    """The profiling mode a request asks for, or None. '1'/'true' select torch."""
+    value = (headers.get("x-colorize-profile") or query.get("profile") or "").strip().lower()
+    if not value or value in ("0", "false", "off"):
+        return None
+    return "torch" if value in ("1", "true", "on") else value
+
+
+def artifact_path(out_dir, profile_id, kind):
+    """kind: 'trace' (torch Chrome trace), 'prof' (cProfile stats) or 'txt' (text summary)."""
+    suffix = {"trace": ".trace.json", "prof": ".prof", "txt": ".txt"}[kind]
+    return os.path.join(out_dir, profile_id + suffix)
+
+
+def prune(out_dir, keep):
+    """Keeps the `keep` most recent profiles."""
+    ids = {}
+    for name in os.listdir(out_dir):
+        profile_id = name.split(".", 1)[0]
+        if PROFILE_ID.match(profile_id):
+            ids[profile_id] = max(ids.get(profile_id, 0), os.path.getmtime(os.path.join(out_dir, name)))
+    for profile_id in sorted(ids, key=ids.get)[:-keep or None]:
+        for kind in ("trace", "prof", "txt"):
+            try:
+                os.remove(artifact_path(out_dir, profile_id, kind))
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def capture(out_dir, keep=20):
+    """Profiles the enclosed block if the current request asked for it; otherwise does nothing."""
+    state = current_request.get()
+    if state is None:
+        yield
+        return
+    if state["mode"] not in MODES:
+        state["error"] = f"unknown profile mode {state['mode']!r}; use one of {', '.join(MODES)}"
+        yield
+        return
+
+    os.makedirs(out_dir, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    start = time.perf_counter()
+
+    if state["mode"] == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(artifact_path(out_dir, profile_id, "prof"))
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+            _finish(state, out_dir, profile_id, summary.getvalue(), start, keep)
+        return
+
+    if not _torch_lock.acquire(blocking=False):
+        state["error"] = "another request is being profiled; retry"
+        yield
+        return
+    try:
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True) as prof:
+            yield
+        prof.export_chrome_trace(artifact_path(out_dir, profile_id, "trace"))
+        table = prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=40)
+        _finish(state, out_dir, profile_id, table, start, keep)
+    finally:
+        _torch_lock.release()
+
+
+def _finish(state, out_dir, profile_id, summary, start, keep):
+    with open(artifact_path(out_dir, profile_id, "txt"), "w") as f:
+        f.write(f"mode={state['mode']} wall_seconds={time.perf_counter() - start:.3f}\n\n{summary}")
+    state["id"] = profile_id
+    prune(out_dir, keep)
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from webapp.backend import telemetry
+
+
+def render_key(contents, checkpoint_hash, **settings):
+    """Cache key: upload bytes + the inference settings + the checkpoint that produced the planes."""
+    digest = hashlib.sha256(contents)
+    digest.update(str(checkpoint_hash).encode())
+    for name in sorted(settings):
+        digest.update(f"|{name}={settings[name]}".encode())
+    return digest.hexdigest()[:32]
+
+
+class RenderCache:
+    """
+    LRU store of raw (pre-stretch) prediction planes, bounded by bytes.
+    AB planes are kept as float16, which is far below the 8-bit output quantization,
+    so an entry costs ~5 bytes/px for the grid planes plus 1 byte/px of L.
+    """
+
+    def __init__(self, max_bytes, name="render"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _pack(raw):
+        packed = {"l": raw["l"], "metrics": raw["metrics"], "model_version": raw.get("model_version")}
+        for key in ("a_detail", "b_detail", "a_global", "b_global"):
+            packed[key] = None if raw[key] is None else raw[key].astype(np.float16)
+        packed["nbytes"] = sum(v.nbytes for v in packed.values() if isinstance(v, np.ndarray))
+        return packed
+
+    @staticmethod
+    def _unpack(packed):
+        raw = {"l": packed["l"], "metrics": packed["metrics"], "model_version": packed["model_version"]}
+        for key in ("a_detail", "b_detail", "a_global", "b_global"):
+            raw[key] = None if packed[key] is None else packed[key].astype(np.float32)
+        return raw
+
+    def put(self, key, raw):
+        packed = self._pack(raw)
+        if packed["nbytes"] > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old["nbytes"]
+            self._entries[key] = packed
+            self.bytes += packed["nbytes"]
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted["nbytes"]
+                telemetry.CACHE_REQUESTS.inc(self.name, "evict")
+
+    def get(self, key):
+        """Returns float32 planes for `key`, or None (counted as a miss)."""
+        with self._lock:
+            packed = self._entries.get(key)
+            if packed is not None:
+                self._entries.move_to_end(key)
+        telemetry.CACHE_REQUESTS.inc(self.name, "hit" if packed is not None else "miss")
+        return None if packed is None else self._unpack(packed)
+
+    def shape(self, key):
+        """(height, width) of the planes cached for `key`, or None. Does not unpack, touch LRU order or count."""
+        with self._lock:
+            packed = self._entries.get(key)
+        return None if packed is None else packed["l"].shape[:2]
+
+    def drop_version(self, model_version):
+        """Evicts every entry produced by `model_version` (after that model is swapped out)."""
+        with self._lock:
+            stale = [key for key, packed in self._entries.items() if packed["model_version"] == model_version]
+            for key in stale:
+                self.bytes -= self._entries.pop(key)["nbytes"]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
@@ -0,0 +1,213 @@
+"""
+Pre-fork launcher for the colorization API.
+
+The parent process imports the app, loads and prepares ColorizationNet once,
+binds the listening socket and then forks the workers. The weights live in memory
+the workers only ever read, so the pages stay shared copy-on-write: memory per pod
+no longer grows with the worker count. Each worker pins its intra-op thread pools
+so N workers x T threads never oversubscribe the cores.
+
+Run:
+    python -m webapp.backend.serve --host 0.0.0.0 --port 8000 --workers 4
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import logging
+
+import torch
+
+RESTART_BACKOFF_SECONDS = 1.0      # Delay before restarting a worker that failed to start; doubles per repeat
+MAX_RESTART_BACKOFF_SECONDS = 60.0
+RAPID_FAILURE_SECONDS = 30.0       # A worker that dies sooner than this after starting counts as a failed start
+MAX_RAPID_FAILURES = 5             # Consecutive failed starts of one slot before the supervisor gives up
+
+
+def available_cpus():
+    """CPUs this process may run on (respects container/cgroup CPU sets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def proportional_set_size_mb(pid):
+    """PSS of a process in MB (shared pages split between sharers); None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, threads, log_level):
+    """Body of a forked worker: pin thread pools, then serve on the inherited socket."""
+    import cv2
+    import uvicorn
+
+    # Restore default signal handling; uvicorn installs its own graceful-shutdown handlers
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Forks workers, restarts any that die, and forwards shutdown signals.
+    A worker that dies soon after starting (e.g. a bad checkpoint) is restarted with
+    exponential backoff; after MAX_RAPID_FAILURES such starts in a row the supervisor
+    stops every worker and exits non-zero, so the orchestrator sees the failure.
+    """
+
+    def __init__(self, app, sock, workers, threads, log_level):
+        self.app, self.sock = app, sock
+        self.workers, self.threads, self.log_level = workers, threads, log_level
+        self.children = {}
+        self.started = {}  # slot -> monotonic start time of its current worker
+        self.failures = {}  # slot -> consecutive rapid failures
+        self.pending = {}  # slot -> monotonic time its restart is due
+        self.stopping = False
+        self.gave_up = False
+        self.logger = logging.getLogger("colorize.serve")
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.threads, self.log_level)
+            except BaseException:
+                self.logger.exception("worker slot=%d crashed", slot)
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = slot
+        self.started[slot] = time.monotonic()
+        self.logger.info("worker started slot=%d pid=%d threads=%d", slot, pid, self.threads)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        self.pending.clear()
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report_memory(self):
+        parent = proportional_set_size_mb(os.getpid())
+        workers = [proportional_set_size_mb(pid) for pid in self.children]
+        if parent is None or None in workers:
+            return
+        self.logger.info("memory pss_parent_mb=%.0f pss_workers_mb=%s pss_total_mb=%.0f",
+                         parent, [round(w) for w in workers], parent + sum(workers))
+
+    def schedule_restart(self, slot, pid, status):
+        """Restarts at once after a long-lived worker; backs off (or gives up) after failed starts."""
+        if time.monotonic() - self.started[slot] < RAPID_FAILURE_SECONDS:
+            self.failures[slot] = self.failures.get(slot, 0) + 1
+        else:
+            self.failures[slot] = 0
+        failures = self.failures[slot]
+        if failures >= MAX_RAPID_FAILURES:
+            self.logger.error("worker slot=%d failed %d times within %.0fs of starting; giving up",
+                              slot, failures, RAPID_FAILURE_SECONDS)
+            self.gave_up = True
+            self.stop(None, None)
+            return
+        delay = min(RESTART_BACKOFF_SECONDS * 2 ** (failures - 1), MAX_RESTART_BACKOFF_SECONDS) if failures else 0.0
+        self.logger.warning("worker exited slot=%d pid=%d status=%d, restarting in %.1fs", slot, pid, status, delay)
+        self.pending[slot] = time.monotonic() + delay
+
+    def run(self, memory_report_delay=15.0):
+        """Supervises until shutdown. Returns the exit code: 1 if it gave up on a failing worker."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        report_at = time.monotonic() + memory_report_delay
+        while self.children or self.pending:
+            pid, status = os.waitpid(-1, os.WNOHANG) if self.children else (0, 0)
+            if pid == 0:
+                now = time.monotonic()
+                for slot, due in list(self.pending.items()):
+                    if now >= due:
+                        del self.pending[slot]
+                        self.spawn(slot)
+                if report_at and now >= report_at:
+                    self.report_memory()
+                    report_at = None
+                time.sleep(0.5)
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is not None and not self.stopping:
+                self.schedule_restart(slot, pid, status)
+        return 1 if self.gave_up else 0
+
+
+def main():
+    cpus = available_cpus()
+    default_workers = int(os.environ.get("COLORIZE_WORKERS", max(1, cpus // 2)))
+
+    parser = argparse.ArgumentParser(description="Serve the colorization API from forked workers sharing one model.")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers)
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Intra-op threads per worker (default: available CPUs / workers).")
+    parser.add_argument("--log-level", type=str, default="info")
+    args = parser.parse_args()
+
+    threads = args.threads or max(1, cpus // args.workers)
+
+    # Keep the parent single-threaded: an OpenMP pool created before fork() is not
+    # usable in the children, and the parent never runs inference itself.
+    torch.set_num_threads(1)
+
+    from webapp.backend import main as backend
+
+    if backend.DEVICE.type == "cuda" and args.workers > 1:
+        # CUDA contexts cannot cross fork(); copy-on-write sharing only applies to CPU weights
+        sys.exit("Multiple forked workers require CPU inference; run one worker per GPU instead.")
+
+    # Load once here; each worker's startup hook then only warms up its own copy-on-write view
+    backend.models.load()
+    if backend.resolve_weights(backend.PREVIEW_MODEL_PATH): # Optional distilled preview model
+        backend.preview_models.load()
+
+    sock = bind_socket(args.host, args.port)
+    backend.logger.info("serving host=%s port=%d workers=%d threads_per_worker=%d cpus=%d",
+                        args.host, args.port, args.workers, threads, cpus)
+
+    # Move everything allocated so far (model, modules, app) out of the garbage
+    # collector's reach, so collections in the workers don't dirty shared pages.
+    gc.collect()
+    gc.freeze()
+
+    sys.exit(Supervisor(backend.app, sock, args.workers, threads, args.log_level).run())
+
+
+if __name__ == "__main__":
+    main()
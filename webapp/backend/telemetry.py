@@ -0,0 +1,165 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Per-stage latency buckets (seconds): sub-millisecond encodes up to multi-second 50 MP requests
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MEGAPIXEL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+# Endpoint of the request being served, set once by the HTTP middleware so that
+# helpers deep in the inference code can label their timings without extra arguments.
+current_endpoint = contextvars.ContextVar("current_endpoint", default="none")
+
+
+def _escape(value):
+    """Label value escaping of the Prometheus text format: backslash, double quote, newline."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down (in-flight requests, loaded model info)."""
+
+    kind = "gauge"
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = float(value)
+
+    def dec(self, *label_values, amount=1.0):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition layout."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._series.items()]
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = ("le", _format_value(bound))
+                yield f"{self.name}_bucket", _format_labels(self.labels, label_values, le), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), total
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), count
+
+
+# --- Registry ---
+STAGE_SECONDS = Histogram(
+    "colorize_stage_seconds",
+    "Time spent per processing stage (decode, forward, blend, stretch, encode).",
+    labels=("endpoint", "stage"),
+)
+REQUEST_SECONDS = Histogram(
+    "colorize_request_seconds",
+    "End-to-end request latency.",
+    labels=("endpoint", "status"),
+)
+INPUT_MEGAPIXELS = Histogram(
+    "colorize_input_megapixels",
+    "Decoded input size per request.",
+    labels=("endpoint",),
+    buckets=MEGAPIXEL_BUCKETS,
+)
+IN_FLIGHT = Gauge("colorize_in_flight_requests", "Requests currently being served.", labels=("endpoint",))
+MODEL_INFO = Gauge("colorize_model_info", "Loaded model; the value is always 1.", labels=("device",))
+MODEL_RELOADS = Counter("colorize_model_reloads_total", "Checkpoint reloads by model and result.",
+                        labels=("model", "result"))
+CACHE_REQUESTS = Counter("colorize_cache_requests_total", "Cache lookups by cache and result.", labels=("cache", "result"))
+JOB_ITEMS = Counter("colorize_job_items_total", "Bulk job images processed, by result.", labels=("result",))
+ADMITTED_MEGAPIXELS = Gauge("colorize_admitted_megapixels", "Estimated megapixels of inference currently admitted.")
+ADMISSION_WAIT = Histogram(
+    "colorize_admission_wait_seconds",
+    "Time spent queued for the megapixel budget before inference started.",
+    labels=("endpoint",),
+)
+ADMISSION_REJECTED = Counter("colorize_admission_rejected_total", "Requests refused by admission control.",
+                             labels=("endpoint", "reason"))
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, INPUT_MEGAPIXELS, IN_FLIGHT, MODEL_INFO, MODEL_RELOADS, CACHE_REQUESTS, JOB_ITEMS,
+            ADMITTED_MEGAPIXELS, ADMISSION_WAIT, ADMISSION_REJECTED]
+
+
+def observe_stage(stage, seconds):
+    """Records a stage duration for the endpoint currently being served."""
+    STAGE_SECONDS.observe(current_endpoint.get(), stage, value=seconds)
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as one observation of `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def render_metrics():
+    """Renders every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"